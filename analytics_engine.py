@@ -0,0 +1,109 @@
+import threading
+from collections import OrderedDict
+import pandas as pd
+from config import ANALYTICS_CACHE_MAX_ENTRIES, TREND_MAX_POINTS
+
+DAY_ORDER = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+# Trend range selector options, in months back from today (None = all history)
+TREND_RANGES = {'1M': 1, '3M': 3, '6M': 6, '1Y': 12, 'All': None}
+
+# Bucket sizes from finest to coarsest: (resample rule, chart label, shortest bucket in days)
+TREND_BUCKETS = [
+    ('D', 'Daily', 1),
+    ('W', 'Weekly', 7),
+    ('MS', 'Monthly', 28),
+    ('QS', 'Quarterly', 90),
+    ('YS', 'Yearly', 365)
+]
+
+def compute_analytics(df):
+    """Compute every Analytics page view from a typed bills frame.
+
+    Bills are aggregated once by (day, category); the daily, monthly,
+    category and weekday views are all reduced from that small table
+    instead of each re-grouping the raw bills.
+    """
+    day = df['date'].dt.normalize().rename('day')
+    # dropna=False keeps bills without a category in the daily, monthly and weekday totals
+    by_day_category = df.groupby([day, df['category']], observed=True, dropna=False)['amount'].agg(['sum', 'count'])
+
+    daily = by_day_category.groupby(level='day').sum()
+    daily_sum = daily['sum']
+
+    monthly = daily_sum.groupby(daily_sum.index.to_period('M')).sum().sort_index().tail(12)  # Last 12 months
+    category = by_day_category['sum'].groupby(level='category', observed=True).sum()
+
+    # Mean per bill by weekday, from the per-day sums and counts
+    weekday = daily.groupby(daily.index.dayofweek).sum().reindex(range(7))
+    weekday_mean = weekday['sum'] / weekday['count']
+
+    return {
+        'monthly': pd.DataFrame({'month': monthly.index.astype(str), 'amount': monthly.to_numpy()}),
+        'category': pd.DataFrame({'category': category.index.astype(str), 'amount': category.to_numpy()}),
+        'daily': pd.DataFrame({'date': daily_sum.index, 'amount': daily_sum.to_numpy()}),
+        'weekly': pd.DataFrame({'day': DAY_ORDER, 'avg_amount': weekday_mean.to_numpy()}),
+        'top_expenses': df.nlargest(10, 'amount')[['description', 'amount', 'date', 'category']].reset_index(drop=True)
+    }
+
+def resample_trend(daily, months=None, max_points=TREND_MAX_POINTS):
+    """Spending over a range at the finest bucket size that fits in max_points.
+
+    daily is the 'daily' view (date, amount). Returns (trend frame, bucket
+    label); empty buckets count as zero spending.
+    """
+    series = daily.set_index('date')['amount']
+    if months:
+        start = pd.Timestamp.now().normalize() - pd.DateOffset(months=months)
+        series = series[series.index >= start]
+    if series.empty:
+        return pd.DataFrame({'date': [], 'amount': []}), TREND_BUCKETS[0][1]
+
+    span_days = (series.index.max() - series.index.min()).days + 1
+    for freq, label, min_days in TREND_BUCKETS:
+        # Upper bound on the bucket count, so only the chosen size is resampled
+        if span_days // min_days + 2 <= max_points:
+            break
+    trend = series.resample(freq).sum()
+    return pd.DataFrame({'date': trend.index, 'amount': trend.to_numpy()}), label
+
+class AnalyticsCache:
+    """Precomputed analytics views keyed by (username, data version).
+
+    A new data version means the user's bills changed, so only the latest
+    version per user is kept.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, username, version, bills_df):
+        """Return the views for this data version, computing them on a miss"""
+        if version is None:
+            # Not backed by the bills cache, so there is nothing to key on
+            return compute_analytics(bills_df)
+
+        with self._lock:
+            cached = self._entries.get(username)
+            if cached is not None and cached[0] == version:
+                self._entries.move_to_end(username)
+                return cached[1]
+
+        views = compute_analytics(bills_df)
+        with self._lock:
+            cached = self._entries.get(username)
+            # Another session may have stored a newer version meanwhile
+            if cached is None or cached[0] <= version:
+                self._entries[username] = (version, views)
+                self._entries.move_to_end(username)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return views
+
+_analytics_cache = AnalyticsCache(ANALYTICS_CACHE_MAX_ENTRIES)
+
+def get_analytics(username, bills_df, version):
+    """Analytics views for a user's bills, memoized by data version"""
+    return _analytics_cache.get(username, version, bills_df)
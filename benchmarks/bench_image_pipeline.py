@@ -0,0 +1,113 @@
+"""Benchmark receipt image preprocessing: payload size, latency and extraction accuracy.
+
+Runs every image in a fixture directory through several pipeline settings
+and reports the encoded payload size and preprocessing time. With --gemini
+each variant is also sent to Gemini (bypassing the extraction cache) to
+measure end-to-end latency and compare the extracted total and item count
+against the full-resolution baseline, or against a <image>.json sidecar
+with {"total": ..., "items": ...} when one exists.
+
+    python benchmarks/bench_image_pipeline.py fixtures/receipts
+    python benchmarks/bench_image_pipeline.py fixtures/receipts --gemini
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from image_utils import ImageProcessor  # noqa: E402
+
+# (label, convert_image_format options); "baseline" matches the old behaviour
+VARIANTS = [
+    ("baseline", {"max_dimension": 100000, "quality": 75}),
+    ("jpeg-2048-q85", {"max_dimension": 2048, "quality": 85}),
+    ("jpeg-1600-q80", {"max_dimension": 1600, "quality": 80}),
+    ("jpeg-1600-gray", {"max_dimension": 1600, "quality": 80, "grayscale": True, "autocontrast": True}),
+    ("webp-1600-q80", {"max_dimension": 1600, "quality": 80, "output_format": "WEBP"}),
+    ("webp-1280-gray", {"max_dimension": 1280, "quality": 75, "output_format": "WEBP", "grayscale": True, "autocontrast": True}),
+]
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".heic")
+
+def load_fixtures(directory):
+    fixtures = []
+    for name in sorted(os.listdir(directory)):
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        path = os.path.join(directory, name)
+        with open(path, "rb") as f:
+            data = f.read()
+        expected = None
+        sidecar = os.path.splitext(path)[0] + ".json"
+        if os.path.exists(sidecar):
+            with open(sidecar, "r", encoding="utf-8") as f:
+                expected = json.load(f)
+        fixtures.append((name, data, expected))
+    return fixtures
+
+def extract(image_data, mime_type):
+    """Call Gemini directly so cached extractions don't hide the latency"""
+    import google.generativeai as genai
+    from bill_processor import BillProcessor, RECEIPT_JSON_PROMPT, JSON_GENERATION_CONFIG, get_gemini_model
+
+    generation_config = genai.types.GenerationConfig(**JSON_GENERATION_CONFIG)
+    response = BillProcessor._generate_with_backoff(
+        get_gemini_model(), [{"mime_type": mime_type, "data": image_data}, RECEIPT_JSON_PROMPT], generation_config
+    )
+    _, items = BillProcessor.parse_json_response(response.text)
+    return {"total": round(sum(item["amount"] for item in items), 2), "items": len(items)}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark receipt image preprocessing")
+    parser.add_argument("fixtures", help="Directory of receipt images (optional <name>.json expectations)")
+    parser.add_argument("--gemini", action="store_true", help="Also run extraction and compare accuracy")
+    parser.add_argument("--repeat", type=int, default=3, help="Preprocessing runs per image (best is kept)")
+    args = parser.parse_args()
+
+    fixtures = load_fixtures(args.fixtures)
+    if not fixtures:
+        parser.error(f"no images found in {args.fixtures}")
+
+    print(f"{len(fixtures)} images, {sum(len(d) for _, d, _ in fixtures) / 1024:.0f} KiB uploaded")
+    header = f"{'variant':<16} {'KiB/img':>8} {'prep ms':>8}"
+    if args.gemini:
+        header += f" {'e2e ms':>8} {'total ok':>9} {'items ok':>9}"
+    print(header)
+
+    baseline_results = {}
+    for label, options in VARIANTS:
+        sizes, prep_times, e2e_times, total_hits, item_hits = [], [], [], 0, 0
+        for name, data, expected in fixtures:
+            best = None
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                buffer, mime_type = ImageProcessor.convert_image_format(io.BytesIO(data), **dict(options))
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            payload = buffer.getvalue()
+            sizes.append(len(payload))
+            prep_times.append(best)
+
+            if args.gemini:
+                started = time.perf_counter()
+                result = extract(payload, mime_type)
+                e2e_times.append(best + time.perf_counter() - started)
+                if label == "baseline":
+                    baseline_results[name] = result
+                reference = expected or baseline_results.get(name)
+                if reference:
+                    total_hits += abs(result["total"] - float(reference["total"])) < 0.01
+                    item_hits += result["items"] == int(reference["items"])
+
+        line = f"{label:<16} {statistics.mean(sizes) / 1024:8.0f} {statistics.median(prep_times) * 1000:8.1f}"
+        if args.gemini:
+            line += f" {statistics.median(e2e_times) * 1000:8.0f} {total_hits:>4}/{len(fixtures):<4} {item_hits:>4}/{len(fixtures):<4}"
+        print(line)
+
+if __name__ == "__main__":
+    main()
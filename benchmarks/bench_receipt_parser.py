@@ -0,0 +1,103 @@
+"""Microbenchmark: precompiled receipt parser vs. the previous per-call regex scans.
+
+Run from the repository root:
+
+    python benchmarks/bench_receipt_parser.py --items 5000 --repeat 20
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from receipt_parser import parse_receipt_text, match_category  # noqa: E402
+from constants import EXPENSE_CATEGORIES  # noqa: E402
+
+def legacy_extract_amount(text):
+    for pattern in [r"Total Amount: €(\d+\.?\d*)", r"Total: €(\d+\.?\d*)", r"Amount: €(\d+\.?\d*)",
+                    r"€(\d+\.?\d*)", r"(\d+\.?\d*) ?EUR"]:
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match:
+            try:
+                return float(match.group(1))
+            except ValueError:
+                continue
+    return 0.0
+
+def legacy_extract_date(text):
+    for pattern in [r"Date: (\d{4}-\d{2}-\d{2})", r"(\d{4}-\d{2}-\d{2})",
+                    r"(\d{2}/\d{2}/\d{4})", r"(\d{2}-\d{2}-\d{4})"]:
+        match = re.search(pattern, text)
+        if match:
+            return match.group(1)
+    return None
+
+def legacy_extract_items(text):
+    items = []
+    for line in text.split('\n'):
+        if not line.startswith('-'):
+            continue
+        match = re.match(r"- (.*?): €(\d+\.?\d*) \(Category: (.*?)\)", line)
+        if not match:
+            continue
+        item, amount, category = match.group(1).strip(), float(match.group(2)), match.group(3).strip().lower()
+        if item and amount > 0 and category in ['grocery', 'utensil', 'clothing', 'miscellaneous']:
+            items.append({'item': item, 'amount': amount, 'category': category})
+    return items
+
+def legacy_parse(text):
+    return {
+        'date': legacy_extract_date(text),
+        'total': legacy_extract_amount(text),
+        'items': legacy_extract_items(text)
+    }
+
+def legacy_match_category(cat):
+    if not cat:
+        return EXPENSE_CATEGORIES[0]
+    cat_lower = cat.lower()
+    for c in EXPENSE_CATEGORIES:
+        if cat_lower in c.lower() or c.lower() in cat_lower:
+            return c
+    return EXPENSE_CATEGORIES[0]
+
+def synthetic_response(n_items, seed=0):
+    """A Gemini-style free-text response with n_items lines, date and total at the end"""
+    rng = random.Random(seed)
+    lines = ["Here are the items extracted from the bill:", ""]
+    total = 0.0
+    for i in range(n_items):
+        amount = round(rng.uniform(0.2, 80), 2)
+        total += amount
+        lines.append(f"- Item number {i} with a longer name: €{amount:.2f} (Category: {rng.choice(EXPENSE_CATEGORIES)})")
+        if i % 50 == 0:
+            lines.append("Note: prices include VAT")
+    lines += ["", "Date: 2024-03-15", f"Total Amount: €{total:.2f}"]
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=2000, help="Item lines per synthetic response")
+    parser.add_argument("--repeat", type=int, default=20, help="Parses per timing run")
+    args = parser.parse_args()
+
+    text = synthetic_response(args.items)
+    assert parse_receipt_text(text) == legacy_parse(text), "parsers disagree"
+
+    print(f"response: {args.items} items, {len(text) / 1024:.0f} KiB")
+    for label, fn in (("legacy", legacy_parse), ("parser", parse_receipt_text)):
+        best = min(timeit.repeat(lambda: fn(text), number=args.repeat, repeat=5)) / args.repeat
+        print(f"  {label:<8} {best * 1000:8.2f} ms/parse")
+
+    labels = ["Grocery", "groc", "household utensil", "misc", "food", "clothing store", ""] * 10000
+    assert [match_category(c) for c in labels] == [legacy_match_category(c) for c in labels]
+    print(f"match_category: {len(labels)} labels")
+    for label, fn in (("legacy", legacy_match_category), ("lookup", match_category)):
+        best = min(timeit.repeat(lambda: [fn(c) for c in labels], number=1, repeat=5))
+        print(f"  {label:<8} {best * 1000:8.2f} ms")
+
+if __name__ == "__main__":
+    main()
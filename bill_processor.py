@@ -1,8 +1,103 @@
 import google.generativeai as genai
-import re
+from google.api_core import exceptions as google_exceptions
+import json
+import random
+import threading
+import time
 import streamlit as st
 import os
-from config import GEMINI_MODEL, GENERATION_CONFIG
+from datetime import datetime
+from config import (
+    GEMINI_MODEL,
+    GENERATION_CONFIG,
+    GEMINI_RESPONSE_MODE,
+    EXPENSE_CATEGORIES,
+    GEMINI_MAX_CONCURRENCY,
+    GEMINI_MAX_RETRIES,
+    GEMINI_BACKOFF_BASE_SECONDS,
+    GEMINI_BACKOFF_MAX_SECONDS,
+    EXTRACTION_CACHE_DIR,
+    EXTRACTION_CACHE_MAX_BYTES
+)
+from extraction_cache import ExtractionCache
+import receipt_parser
+
+RECEIPT_PROMPT = """
+            Analyze this bill image and extract individual items with their prices.
+            Format EACH item in EXACTLY this format:
+            - Item name: €XX.XX (Category: category)
+            
+            Use ONLY these categories:
+            - grocery (for food and drink items)
+            - utensil (for household items and tools)
+            - clothing (for all wearable items)
+            - miscellaneous (for everything else)
+
+            Additional guidelines:
+            1. Each item MUST start with a hyphen (-)
+            2. Each price MUST be in euros (€)
+            3. Each category MUST be one of the four listed above
+            4. Include the date if visible (Format: YYYY-MM-DD)
+            5. Be as accurate as possible with item names and prices
+            """
+
+RECEIPT_JSON_PROMPT = """
+            Analyze this bill image and extract every purchased item with its price in euros.
+            Assign each item exactly one category:
+            - grocery (for food and drink items)
+            - utensil (for household items and tools)
+            - clothing (for all wearable items)
+            - miscellaneous (for everything else)
+            Set date to the receipt date as YYYY-MM-DD, or null if it is not visible.
+            Be as accurate as possible with item names and prices.
+            """
+
+# Schema-constrained output for the structured extraction mode
+RECEIPT_RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "date": {"type": "STRING", "nullable": True},
+        "items": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "item": {"type": "STRING"},
+                    "amount": {"type": "NUMBER"},
+                    "category": {"type": "STRING", "format": "enum", "enum": EXPENSE_CATEGORIES}
+                },
+                "required": ["item", "amount", "category"]
+            }
+        }
+    },
+    "required": ["items"]
+}
+
+JSON_GENERATION_CONFIG = {
+    **GENERATION_CONFIG,
+    "response_mime_type": "application/json",
+    "response_schema": RECEIPT_RESPONSE_SCHEMA
+}
+
+# Errors that mean "slow down" rather than "this request is wrong"
+RETRYABLE_GEMINI_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.TooManyRequests,
+    google_exceptions.ServiceUnavailable
+)
+
+# Caps in-flight Gemini calls across all sessions in this process
+_gemini_slots = threading.BoundedSemaphore(GEMINI_MAX_CONCURRENCY)
+
+# One configured model per process; the underlying client is thread-safe
+_gemini_model = None
+_gemini_model_lock = threading.Lock()
+_warm_up_started = False
+_generation_config = genai.types.GenerationConfig(**GENERATION_CONFIG)
+_json_generation_config = genai.types.GenerationConfig(**JSON_GENERATION_CONFIG)
+
+# Shared across sessions so re-processing the same receipt skips the API call
+_extraction_cache = ExtractionCache(EXTRACTION_CACHE_DIR, EXTRACTION_CACHE_MAX_BYTES)
 
 def get_google_api_key():
     """Get Google API Key from Streamlit secrets or environment variables"""
@@ -10,130 +105,289 @@ def get_google_api_key():
         return st.secrets["GOOGLE_API_KEY"]
     return os.getenv("GOOGLE_API_KEY")
 
+def get_gemini_model():
+    """Return the process-wide Gemini model, configuring the API on first use"""
+    global _gemini_model
+    if _gemini_model is None:
+        with _gemini_model_lock:
+            if _gemini_model is None:
+                google_api_key = get_google_api_key()
+                if not google_api_key:
+                    raise ValueError("GOOGLE_API_KEY not found in environment variables or Streamlit secrets")
+                
+                genai.configure(api_key=google_api_key)
+                _gemini_model = genai.GenerativeModel(GEMINI_MODEL)
+                print("Google Gemini API configured successfully")
+    return _gemini_model
+
+def warm_up_gemini():
+    """Build the shared model and open its connection in the background, once per process"""
+    global _warm_up_started
+    with _gemini_model_lock:
+        if _warm_up_started:
+            return
+        _warm_up_started = True
+    
+    def warm_up():
+        try:
+            # A token count is the cheapest call that establishes the channel
+            get_gemini_model().count_tokens("warm-up")
+            print("Gemini model warmed up")
+        except Exception as e:
+            print(f"Gemini warm-up failed: {e}")
+    
+    threading.Thread(target=warm_up, name="gemini-warm-up", daemon=True).start()
+
+class _LineItemParser:
+    """Incrementally parses '- Item: €X (Category: y)' lines from streamed text"""
+
+    def __init__(self):
+        self._pending = ""
+
+    def feed(self, text):
+        *lines, self._pending = (self._pending + text).split('\n')
+        return [item for item in map(BillProcessor.parse_item_line, lines) if item]
+
+    def finish(self):
+        item = BillProcessor.parse_item_line(self._pending)
+        self._pending = ""
+        return [item] if item else []
+
+class _JsonItemParser:
+    """Incrementally extracts item objects from a streamed JSON receipt response.
+
+    Every object nested one level below the top-level object is an item in
+    the schema, so each is parsed as soon as its closing brace arrives.
+    """
+
+    def __init__(self):
+        self._buffer = []
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, text):
+        items = []
+        for char in text:
+            if self._depth >= 2:
+                self._buffer.append(char)
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == '{':
+                self._depth += 1
+                if self._depth == 2:
+                    self._buffer = ['{']
+            elif char == '}':
+                self._depth -= 1
+                if self._depth == 1:
+                    try:
+                        item = BillProcessor.validate_item(json.loads("".join(self._buffer)))
+                    except ValueError:
+                        item = None
+                    if item:
+                        items.append(item)
+                    self._buffer = []
+        return items
+
+    def finish(self):
+        return []
+
 class BillProcessor:
     def __init__(self):
-        # Configure the API key
-        google_api_key = get_google_api_key()
-        if google_api_key:
-            genai.configure(api_key=google_api_key)
-            print("Google Gemini API configured successfully")
-        else:
-            raise ValueError("GOOGLE_API_KEY not found in environment variables or Streamlit secrets")
+        # Reuse the shared, already configured model
+        self.model = get_gemini_model()
 
     @staticmethod
     def extract_amount(text):
-        # Look for amount patterns
-        amount_patterns = [
-            r"Total Amount: €(\d+\.?\d*)",
-            r"Total: €(\d+\.?\d*)",
-            r"Amount: €(\d+\.?\d*)",
-            r"€(\d+\.?\d*)",
-            r"(\d+\.?\d*) ?EUR",
-        ]
-        
-        for pattern in amount_patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                try:
-                    return float(match.group(1))
-                except ValueError:
-                    continue
-        return 0.0
+        return receipt_parser.extract_total(text)
 
     @staticmethod
     def extract_date(text):
-        # Look for date patterns
-        date_patterns = [
-            r"Date: (\d{4}-\d{2}-\d{2})",
-            r"(\d{4}-\d{2}-\d{2})",
-            r"(\d{2}/\d{2}/\d{4})",
-            r"(\d{2}-\d{2}-\d{4})"
-        ]
-        
-        for pattern in date_patterns:
-            match = re.search(pattern, text)
-            if match:
-                return match.group(1)
-        return None
+        return receipt_parser.extract_date(text)
+
+    @staticmethod
+    def parse_item_line(line):
+        """Parse one '- Item: €X (Category: y)' line, or return None"""
+        return receipt_parser.parse_item_line(line)
 
     @staticmethod
     def extract_items(text):
-        items = []
-        lines = text.split('\n')
-        for line in lines:
-            if line.startswith('-'):
-                item_pattern = r"- (.*?): €(\d+\.?\d*) \(Category: (.*?)\)"
-                match = re.match(item_pattern, line)
-                if match:
-                    item = match.group(1).strip()
-                    try:
-                        amount = float(match.group(2))
-                        category = match.group(3).strip().lower()
-                        # Only add valid items
-                        if item and amount > 0 and category in ['grocery', 'utensil', 'clothing', 'miscellaneous']:
-                            items.append({
-                                'item': item,
-                                'amount': amount,
-                                'category': category
-                            })
-                    except ValueError:
-                        continue
-        return items
+        return receipt_parser.extract_items(text)
+
+    @staticmethod
+    def _backoff_delay(attempt):
+        # Exponential backoff with jitter so concurrent receipts don't retry in lockstep
+        delay = min(GEMINI_BACKOFF_MAX_SECONDS, GEMINI_BACKOFF_BASE_SECONDS * (2 ** attempt))
+        return delay + random.uniform(0, delay / 2)
+
+    @staticmethod
+    def _generate_with_backoff(model, contents, generation_config, **kwargs):
+        """Call Gemini under the process-wide concurrency limit, backing off on rate limits"""
+        for attempt in range(GEMINI_MAX_RETRIES + 1):
+            try:
+                with _gemini_slots:
+                    return model.generate_content(contents, generation_config=generation_config, **kwargs)
+            except RETRYABLE_GEMINI_ERRORS as e:
+                if attempt == GEMINI_MAX_RETRIES:
+                    raise
+                delay = BillProcessor._backoff_delay(attempt)
+                print(f"Gemini rate limited ({e}); retrying in {delay:.1f}s")
+                time.sleep(delay)
 
-    def process_with_gemini(self, image_data, mime_type):
+    @staticmethod
+    def _stream_with_backoff(model, contents, generation_config):
+        """Yield streamed response text, holding a concurrency slot for the whole stream"""
+        for attempt in range(GEMINI_MAX_RETRIES + 1):
+            started = False
+            try:
+                with _gemini_slots:
+                    response = model.generate_content(contents, generation_config=generation_config, stream=True)
+                    for chunk in response:
+                        started = True
+                        yield chunk.text
+                return
+            except RETRYABLE_GEMINI_ERRORS as e:
+                # Text already handed out can't be taken back, so only retry before the first chunk
+                if started or attempt == GEMINI_MAX_RETRIES:
+                    raise
+                delay = BillProcessor._backoff_delay(attempt)
+                print(f"Gemini rate limited ({e}); retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def _stream_text(self, contents, generation_config, parser, on_item):
+        """Stream the response, reporting each item as soon as the parser completes it"""
+        text_parts = []
+        for piece in self._stream_with_backoff(self.model, contents, generation_config):
+            text_parts.append(piece)
+            for item in parser.feed(piece):
+                on_item(item)
+        
+        for item in parser.finish():
+            on_item(item)
+        return "".join(text_parts)
+
+    @staticmethod
+    def validate_item(obj):
+        """Coerce one structured item into {'item', 'amount', 'category'}, or return None"""
+        if not isinstance(obj, dict):
+            return None
+        
+        item = str(obj.get('item') or '').strip()
         try:
-            # Configure the API key if not already done
-            google_api_key = get_google_api_key()
-            if google_api_key:
-                genai.configure(api_key=google_api_key)
-            
-            model = genai.GenerativeModel(GEMINI_MODEL)
-            
-            prompt = """
-            Analyze this bill image and extract individual items with their prices.
-            Format EACH item in EXACTLY this format:
-            - Item name: €XX.XX (Category: category)
-            
-            Use ONLY these categories:
-            - grocery (for food and drink items)
-            - utensil (for household items and tools)
-            - clothing (for all wearable items)
-            - miscellaneous (for everything else)
+            amount = float(obj.get('amount'))
+        except (TypeError, ValueError):
+            return None
+        category = str(obj.get('category') or '').strip().lower()
+        if category not in EXPENSE_CATEGORIES:
+            # Keep the item rather than silently dropping it
+            category = 'miscellaneous'
+        
+        if not item or amount <= 0:
+            return None
+        return {
+            'item': item,
+            'amount': round(amount, 2),
+            'category': category
+        }
 
-            Additional guidelines:
-            1. Each item MUST start with a hyphen (-)
-            2. Each price MUST be in euros (€)
-            3. Each category MUST be one of the four listed above
-            4. Include the date if visible (Format: YYYY-MM-DD)
-            5. Be as accurate as possible with item names and prices
-            """
-            
+    @staticmethod
+    def parse_json_response(text):
+        """Validate a structured response into (date, items); raises ValueError if malformed"""
+        data = json.loads(text)
+        if not isinstance(data, dict) or not isinstance(data.get('items'), list):
+            raise ValueError("Structured response has no items list")
+        
+        items = [item for item in map(BillProcessor.validate_item, data['items']) if item]
+        
+        date = data.get('date')
+        try:
+            date = datetime.strptime(str(date), '%Y-%m-%d').strftime('%Y-%m-%d') if date else None
+        except ValueError:
+            date = None
+        return date, items
+
+    def _extract(self, image_data, mime_type, structured, on_item):
+        """Run one extraction in structured (JSON) or free-text mode"""
+        if structured:
+            prompt, config_key, generation_config = RECEIPT_JSON_PROMPT, JSON_GENERATION_CONFIG, _json_generation_config
+        else:
+            prompt, config_key, generation_config = RECEIPT_PROMPT, GENERATION_CONFIG, _generation_config
+        
+        cache_key = ExtractionCache.make_key(image_data, prompt, GEMINI_MODEL, config_key)
+        cached = _extraction_cache.get(cache_key)
+        
+        if cached is not None:
+            extracted_text = cached["raw_text"]
+            print("AI Response served from extraction cache")
+        else:
             # Prepare the image for Gemini
             image_part = {
                 "mime_type": mime_type,
-                "data": image_data
+                # image_data may be a memoryview of the upload; the client needs bytes
+                "data": bytes(image_data)
             }
             
-            response = model.generate_content(
-                [image_part, prompt],
-                generation_config=genai.types.GenerationConfig(**GENERATION_CONFIG)
-            )
-
-            extracted_text = response.text
+            if on_item:
+                parser = _JsonItemParser() if structured else _LineItemParser()
+                extracted_text = self._stream_text([image_part, prompt], generation_config, parser, on_item)
+            else:
+                response = self._generate_with_backoff(self.model, [image_part, prompt], generation_config)
+                extracted_text = response.text
             print(f"AI Response: {extracted_text}")  # Debug output
-            
-            date = self.extract_date(extracted_text)
-            items = self.extract_items(extracted_text)
-            
+        
+        # Parse on every call, so cached responses pick up parser fixes
+        if structured:
+            date, items = self.parse_json_response(extracted_text)
+        else:
+            parsed = receipt_parser.parse_receipt_text(extracted_text)
+            date, items = parsed['date'], parsed['items']
+        
+        if cached is None:
+            # Only cache responses that parsed, so a bad one is retried next time
+            _extraction_cache.put(cache_key, {"raw_text": extracted_text})
+        elif on_item:
+            for item in items:
+                on_item(item)
+        
+        return {
+            'raw_text': extracted_text,
             # Calculate total amount from items
-            total_amount = sum(item['amount'] for item in items)
-            
-            return {
-                'raw_text': extracted_text,
-                'amount': total_amount,
-                'date': date,
-                'items': items
-            }
+            'amount': sum(item['amount'] for item in items),
+            'date': date,
+            'items': items
+        }
+
+    def process_with_gemini(self, image_data, mime_type, on_item=None):
+        """Extract a receipt's items and date.
+        
+        In structured mode Gemini returns schema-constrained JSON, falling
+        back to the free-text prompt and regex parsing if that fails. With
+        on_item, the response is streamed and on_item is called with each
+        parsed item as soon as it is complete.
+        """
+        try:
+            if GEMINI_RESPONSE_MODE == "json":
+                try:
+                    return self._extract(image_data, mime_type, True, on_item)
+                except RETRYABLE_GEMINI_ERRORS:
+                    # Backoff already gave up; the text request would hit the same limit
+                    raise
+                except (ValueError, google_exceptions.GoogleAPICallError) as e:
+                    # Malformed JSON, or the structured request itself was rejected
+                    # (e.g. InvalidArgument for response_schema)
+                    # The streamed preview already has the structured items, so
+                    # the fallback result simply replaces it when the job finishes
+                    print(f"Structured extraction failed ({e}); falling back to text parsing")
+                    on_item = None
+            return self._extract(image_data, mime_type, False, on_item)
 
         except Exception as e:
             print(f"Error in process_with_gemini: {str(e)}")
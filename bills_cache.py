@@ -0,0 +1,217 @@
+import threading
+import time
+from collections import OrderedDict
+import pandas as pd
+from search_index import BillSearchIndex
+from bills_frame import normalize_bills_frame
+
+class BillsCache:
+    """Process-wide per-user bills cache with TTL expiry and LRU eviction by memory size"""
+
+    def __init__(self, ttl_seconds=300, max_bytes=64 * 1024 * 1024):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        # Bumped whenever any cached frame changes; never reused, even after eviction
+        self._version = 0
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _frame_size(df):
+        """Approximate memory footprint of a cached frame in bytes"""
+        if df.empty:
+            return 0
+        return int(df.memory_usage(index=True, deep=True).sum())
+
+    @staticmethod
+    def _normalize_frame(df):
+        # Concatenation loses the categorical dtype, so re-type after every merge
+        return normalize_bills_frame(df)
+
+    def get(self, username):
+        """Return a copy of the cached bills for a user, or None if missing or expired"""
+        cached = self.get_with_version(username)
+        return cached[0] if cached is not None else None
+
+    def get_with_version(self, username, allow_expired=False):
+        """Return (bills copy, data version) for a user, or None if missing or expired.
+
+        The version changes whenever the user's cached bills do, so it can
+        key memoized results derived from the frame. allow_expired returns
+        the last snapshot regardless of age, for when a refresh failed.
+        """
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None:
+                return None
+
+            if not allow_expired and time.monotonic() - entry["loaded_at"] > self.ttl_seconds:
+                # Expired entries stay around as a snapshot for incremental sync
+                return None
+
+            self._entries.move_to_end(username)
+            # Pages mutate the frame they receive, so never hand out the cached one
+            return entry["frame"].copy(), entry["version"]
+
+    def get_sync_state(self, username):
+        """Return the sync watermarks of a user's snapshot, or None if not cached"""
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None:
+                return None
+            return {
+                "watermarks": dict(entry["watermarks"]),
+                "full_loaded_at": entry["full_loaded_at"]
+            }
+
+    def put(self, username, df, watermarks=None):
+        """Store a full load of a user's bills, evicting least recently used users if over budget"""
+        with self._lock:
+            now = time.monotonic()
+            self._drop(username)
+            self._store(username, self._normalize_frame(df), now, watermarks or {}, now)
+            self._evict()
+
+    def apply_changes(self, username, changed_df, deleted_ids, watermarks):
+        """Merge an incremental sync into a user's snapshot and mark it fresh"""
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None:
+                return
+
+            frame = entry["frame"]
+            if not frame.empty and 'id' in frame.columns:
+                stale_ids = set(deleted_ids)
+                if not changed_df.empty:
+                    stale_ids.update(changed_df['id'])
+                if stale_ids:
+                    frame = frame[~frame['id'].isin(stale_ids)]
+
+            if not changed_df.empty:
+                frame = pd.concat([frame, changed_df], ignore_index=True)
+
+            search_index = entry["search_index"]
+            if search_index is not None:
+                search_index.remove_many(deleted_ids)
+                if not changed_df.empty:
+                    search_index.add_many(zip(changed_df['id'], changed_df['description']))
+
+            full_loaded_at = entry["full_loaded_at"]
+            # A sync that found nothing new keeps the version, so derived results stay valid
+            unchanged = changed_df.empty and not deleted_ids
+            self._drop(username)
+            self._store(
+                username, self._normalize_frame(frame), time.monotonic(), watermarks, full_loaded_at, search_index,
+                version=entry["version"] if unchanged else None
+            )
+            self._evict()
+
+    def get_search_index(self, username):
+        """Return the description search index for a cached user, building it on first use"""
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None:
+                return None
+            if entry["search_index"] is not None:
+                return entry["search_index"]
+            # Cached frames are replaced, never modified, so it is safe to read outside the lock
+            frame, version = entry["frame"], entry["version"]
+
+        # Building takes seconds for large histories; don't block other sessions meanwhile
+        search_index = BillSearchIndex.from_frame(frame)
+
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None or entry["version"] != version:
+                # The bills changed while building; serve this search but don't cache a stale index
+                return search_index
+            if entry["search_index"] is not None:
+                # Another session finished first
+                return entry["search_index"]
+
+            # Re-store so the index counts toward the entry's size and the cache budget
+            self._drop(username)
+            self._store(
+                username, entry["frame"], entry["loaded_at"], entry["watermarks"], entry["full_loaded_at"],
+                search_index, version=version
+            )
+            self._evict()
+            return search_index
+
+    def add_bills(self, username, bills):
+        """Write-through newly saved bills into a cached user's frame"""
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None or not bills:
+                return
+
+            frame = pd.concat([entry["frame"], pd.DataFrame(bills)], ignore_index=True)
+            if entry["search_index"] is not None:
+                entry["search_index"].add_many((bill["id"], bill.get("description")) for bill in bills)
+            self._replace_frame(username, self._normalize_frame(frame))
+
+    def remove_bills(self, bill_ids, username=None):
+        """Drop deleted bills from the cache; scans all users when username is unknown"""
+        bill_ids = set(bill_ids)
+        with self._lock:
+            usernames = [username] if username else list(self._entries.keys())
+            for name in usernames:
+                entry = self._entries.get(name)
+                if entry is None or entry["frame"].empty or 'id' not in entry["frame"].columns:
+                    continue
+
+                mask = entry["frame"]['id'].isin(bill_ids)
+                if mask.any():
+                    if entry["search_index"] is not None:
+                        entry["search_index"].remove_many(bill_ids)
+                    self._replace_frame(name, entry["frame"][~mask].reset_index(drop=True))
+
+    def invalidate(self, username):
+        with self._lock:
+            self._drop(username)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def _store(self, username, frame, loaded_at, watermarks, full_loaded_at, search_index=None, version=None):
+        size = self._frame_size(frame)
+        if search_index is not None:
+            size += search_index.memory_usage()
+        if version is None:
+            self._version += 1
+            version = self._version
+        self._entries[username] = {
+            "frame": frame,
+            "size": size,
+            "loaded_at": loaded_at,
+            "watermarks": watermarks,
+            "full_loaded_at": full_loaded_at,
+            # Built lazily by the first search, then patched alongside the frame
+            "search_index": search_index,
+            "version": version
+        }
+        self._total_bytes += size
+
+    def _replace_frame(self, username, frame):
+        # Patching keeps the original load time and watermarks, so the next
+        # sync still re-reads the patched documents from Firestore
+        entry = self._entries[username]
+        self._drop(username)
+        self._store(
+            username, frame, entry["loaded_at"], entry["watermarks"], entry["full_loaded_at"], entry["search_index"]
+        )
+        self._evict()
+
+    def _drop(self, username):
+        entry = self._entries.pop(username, None)
+        if entry is not None:
+            self._total_bytes -= entry["size"]
+
+    def _evict(self):
+        # Always keep the most recently used entry, even if it alone exceeds the budget
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            username, _ = next(iter(self._entries.items()))
+            self._drop(username)
@@ -0,0 +1,36 @@
+import pandas as pd
+from config import EXPENSE_CATEGORIES
+
+# Columns of the typed bills frame handed to pages. Firestore bookkeeping
+# fields (username, created_at, updated_at) are dropped.
+BILL_FRAME_COLUMNS = ['id', 'date', 'month', 'category', 'amount', 'description']
+
+def empty_bills_frame():
+    """Typed bills frame with no rows"""
+    return normalize_bills_frame(pd.DataFrame(columns=BILL_FRAME_COLUMNS))
+
+def build_bills_frame(bills):
+    """Build a typed, newest-first bills frame from raw bill documents"""
+    return normalize_bills_frame(pd.DataFrame(list(bills)))
+
+def normalize_bills_frame(df):
+    """Coerce a bills frame to its compact typed layout, sorted newest first.
+
+    date is datetime64, month a monthly Period, category a categorical and
+    amount float64, so pages never re-parse dates or amounts.
+    """
+    df = df.reindex(columns=[column for column in BILL_FRAME_COLUMNS if column != 'month'])
+
+    if not pd.api.types.is_datetime64_any_dtype(df['date']):
+        df['date'] = pd.to_datetime(df['date'].astype(str), format='mixed', errors='coerce')
+    df['month'] = df['date'].dt.to_period('M')
+
+    observed = set(df['category'].dropna().astype(str))
+    categories = EXPENSE_CATEGORIES + sorted(observed - set(EXPENSE_CATEGORIES))
+    df['category'] = pd.Categorical(df['category'].astype(object), categories=categories)
+
+    df['amount'] = pd.to_numeric(df['amount'], errors='coerce').fillna(0.0).astype('float64')
+    df['description'] = df['description'].fillna('').astype(str)
+
+    df = df[BILL_FRAME_COLUMNS]
+    return df.sort_values('date', ascending=False, kind='stable').reset_index(drop=True)
@@ -2,6 +2,7 @@ import os
 import streamlit as st
 from dotenv import load_dotenv
 from datetime import datetime, timezone
+from constants import EXPENSE_CATEGORIES
 
 # Load environment variables for local development
 load_dotenv()
@@ -32,11 +33,91 @@ GENERATION_CONFIG = {
     "max_output_tokens": 2048
 }
 
+# "json" requests schema-constrained output; "text" uses the line format and regex parsing
+GEMINI_RESPONSE_MODE = "json"
+
+# Stream receipt extraction so items show up while Gemini is still generating
+GEMINI_STREAMING = True
+
+# Gemini concurrency and rate-limit backoff
+GEMINI_MAX_CONCURRENCY = 4
+GEMINI_MAX_RETRIES = 4
+GEMINI_BACKOFF_BASE_SECONDS = 1.0
+GEMINI_BACKOFF_MAX_SECONDS = 30.0
+
+# Bills cache configurations
+BILLS_CACHE_TTL_SECONDS = 300
+BILLS_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# Incremental bills sync configurations
+BILLS_SYNC_OVERLAP_SECONDS = 2
+BILLS_FULL_RESYNC_SECONDS = 6 * 60 * 60
+BILLS_TOMBSTONE_RETENTION_DAYS = 30
+
+# My Bills page size for server-side pagination
+BILLS_PAGE_SIZE = 50
+
+# Firestore allows at most 500 writes per WriteBatch commit
+BATCH_WRITE_LIMIT = 500
+
+# Each user's history is rescanned for duplicate bills in the background
+# at most this often
+DUPLICATE_SCAN_INTERVAL_SECONDS = 24 * 60 * 60
+
+# Deleting a bill takes up to four writes: the bill, its tombstone, its dedup
+# key and, at worst, a rollup of its own (owner, month). The months are only
+# known once the delete transaction reads the bills, so chunks are sized for
+# that worst case
+BULK_DELETE_WRITES_PER_BILL = 4
+BULK_DELETE_CHUNK_SIZE = BATCH_WRITE_LIMIT // BULK_DELETE_WRITES_PER_BILL
+BULK_DELETE_WORKERS = 4
+
+# Precomputed Analytics page views kept per (user, data version)
+ANALYTICS_CACHE_MAX_ENTRIES = 256
+# Most points the spending trend chart plots; longer ranges use coarser buckets
+TREND_MAX_POINTS = 400
+
+# On-disk cache of Gemini receipt extractions
+EXTRACTION_CACHE_DIR = os.path.join(".cache", "extractions")
+EXTRACTION_CACHE_MAX_BYTES = 50 * 1024 * 1024
+
+# Stored receipt images; perceptual hashes within this many bits (of 64)
+# are flagged as the same receipt
+RECEIPT_STORE_DIR = os.path.join("data", "receipts")
+RECEIPT_DUPLICATE_MAX_DISTANCE = 6
+# Receipts with no saved bills (abandoned, duplicates, or whose bills were
+# deleted) are removed after this long; pruning runs at most once an interval
+RECEIPT_UNLINKED_TTL_SECONDS = 24 * 60 * 60
+RECEIPT_PRUNE_INTERVAL_SECONDS = 60 * 60
+
+# Background receipt processing
+RECEIPT_JOB_WORKERS = 4
+RECEIPT_JOB_TTL_SECONDS = 60 * 60
+RECEIPT_JOB_POLL_SECONDS = 1
+MAX_BATCH_RECEIPTS = 50
+
 # Image processing configurations
 SUPPORTED_IMAGE_TYPES = ["jpg", "jpeg", "png", "heic"]
 
-# Categories
-EXPENSE_CATEGORIES = ["grocery", "utensil", "clothing", "miscellaneous"]
+# Receipt preprocessing before upload to Gemini. Receipt text stays legible
+# well below phone camera resolution, so images are downscaled and recompressed.
+IMAGE_MAX_DIMENSION = 2048
+IMAGE_OUTPUT_FORMAT = "JPEG"  # "JPEG" or "WEBP"
+IMAGE_OUTPUT_QUALITY = 85
+IMAGE_GRAYSCALE = False
+IMAGE_AUTOCONTRAST = False
+# Upright RGB JPEGs within IMAGE_MAX_DIMENSION and this size are sent as uploaded
+IMAGE_PASSTHROUGH_MAX_BYTES = 2 * 1024 * 1024
+
+# HEIC/PNG/oversized decoding runs in a process pool so it scales across
+# cores; small inputs are cheaper to decode in-process than to ship over IPC
+IMAGE_DECODE_WORKERS = min(4, os.cpu_count() or 1)
+# Per job, counted from when a worker starts on it
+IMAGE_DECODE_TIMEOUT_SECONDS = 30
+IMAGE_DECODE_INLINE_MAX_BYTES = 256 * 1024
+
+# Categories: EXPENSE_CATEGORIES is defined in constants.py, so stdlib-only
+# modules such as receipt_parser share the same list, and re-exported here
 
 def get_current_utc_datetime():
     return datetime.now(timezone.utc)
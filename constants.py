@@ -1 +1 @@
-EXPENSE_CATEGORIES = ['grocery', 'utensil', 'clothing', 'miscellaneous']
\ No newline at end of file
+EXPENSE_CATEGORIES = ['grocery', 'utensil', 'clothing', 'miscellaneous']
@@ -1,41 +1,163 @@
 import firebase_admin
 from firebase_admin import credentials, firestore, auth
 from google.cloud.firestore_v1.base_query import FieldFilter
+from google.cloud.firestore_v1.field_path import FieldPath
 import pandas as pd
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import hashlib
 import pyrebase
 import streamlit as st
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import json
 import os
+from bills_cache import BillsCache
+from bills_frame import build_bills_frame, empty_bills_frame
+from config import (
+    BILLS_CACHE_TTL_SECONDS,
+    BILLS_CACHE_MAX_BYTES,
+    BILLS_SYNC_OVERLAP_SECONDS,
+    BILLS_FULL_RESYNC_SECONDS,
+    BILLS_TOMBSTONE_RETENTION_DAYS,
+    BATCH_WRITE_LIMIT,
+    BULK_DELETE_CHUNK_SIZE,
+    BULK_DELETE_WORKERS,
+    DUPLICATE_SCAN_INTERVAL_SECONDS,
+    EXPENSE_CATEGORIES
+)
+
+# Process-wide connection shared by every FirebaseHandler instance.
+# Streamlit runs each session's script in its own thread, so access is
+# guarded by a lock and the connection is only built once per process.
+_connection = None
+_connection_lock = threading.Lock()
+
+# Users whose monthly rollups are known to have been built
+_rollups_ready = set()
+
+# When each user's duplicate scan was last checked for staleness in this process
+_duplicate_scans_checked = {}
+_duplicate_scans_lock = threading.Lock()
+
+# Per-user bills cache shared across sessions, kept in sync on save/delete
+_bills_cache = BillsCache(
+    ttl_seconds=BILLS_CACHE_TTL_SECONDS,
+    max_bytes=BILLS_CACHE_MAX_BYTES
+)
 
 class FirebaseHandler:
     def __init__(self):
+        connection = self._get_connection()
+        self.db = connection["db"]
+        self.firebase = connection["firebase"]
+        # Auth objects keep per-login state, so each handler gets its own
+        # view on top of the shared Pyrebase app and HTTP session
+        self.auth = self.firebase.auth()
+
+    def _get_connection(self):
+        """Return the shared connection, creating it on first use"""
+        global _connection
+        if _connection is None:
+            with _connection_lock:
+                if _connection is None:
+                    _connection = self._connect()
+        return _connection
+
+    def _connect(self, app_name=None):
+        """Initialize Firebase Admin, Firestore and Pyrebase clients.
+        
+        With app_name the clients are built on their own named Admin app,
+        so a reconnect never has to tear down the default app.
+        """
         # Initialize Firebase Admin SDK (for server-side operations)
-        if not firebase_admin._apps:
-            try:
-                # Try to get Firebase credentials from multiple sources
-                service_account_info = self._get_firebase_credentials()
-                
-                if service_account_info:
-                    cred = credentials.Certificate(service_account_info)
-                    firebase_admin.initialize_app(cred)
-                    print("Firebase Admin SDK initialized successfully")
+        if app_name or not firebase_admin._apps:
+            app = self._initialize_admin_app(app_name)
+        else:
+            app = firebase_admin.get_app()
+        
+        try:
+            db = firestore.client(app=app)
+            
+            # Initialize Pyrebase for client-side authentication
+            firebase_config = self._get_firebase_config()
+            firebase = pyrebase.initialize_app(firebase_config)
+        except Exception:
+            if app_name:
+                firebase_admin.delete_app(app)
+            raise
+        
+        return {
+            "db": db,
+            "firebase": firebase,
+            # Named apps belong to this connection and are deleted with it
+            "app": app if app_name else None,
+            "created_at": datetime.now()
+        }
+
+    def _initialize_admin_app(self, app_name=None):
+        """Initialize the default Firebase Admin app, or a named one"""
+        try:
+            # Try to get Firebase credentials from multiple sources
+            service_account_info = self._get_firebase_credentials()
+            
+            if service_account_info:
+                cred = credentials.Certificate(service_account_info)
+                if app_name:
+                    app = firebase_admin.initialize_app(cred, name=app_name)
                 else:
-                    raise ValueError("No valid Firebase credentials found")
-                
-            except Exception as e:
-                error_msg = f"Failed to initialize Firebase Admin: {e}"
-                print(error_msg)
-                st.error(error_msg)
-                raise e
+                    app = firebase_admin.initialize_app(cred)
+                print("Firebase Admin SDK initialized successfully")
+                return app
+            else:
+                raise ValueError("No valid Firebase credentials found")
+            
+        except Exception as e:
+            error_msg = f"Failed to initialize Firebase Admin: {e}"
+            print(error_msg)
+            st.error(error_msg)
+            raise e
+
+    def check_health(self):
+        """Run a minimal Firestore read to verify the shared connection"""
+        try:
+            self.db.collection('users').limit(1).get(timeout=5)
+            return True
+        except Exception as e:
+            print(f"Firestore health check failed: {e}")
+            return False
+
+    def reconnect(self):
+        """Build a fresh shared connection, then swap it in.
         
-        self.db = firestore.client()
+        The old connection is only dropped once the new one is ready, so a
+        failed reconnect leaves it, and the default Admin app, untouched.
+        """
+        global _connection
+        with _connection_lock:
+            connection = self._connect(app_name=f"biller-{time.time_ns()}")
+            previous, _connection = _connection, connection
+        
+        if previous and previous.get("app") is not None:
+            try:
+                firebase_admin.delete_app(previous["app"])
+            except Exception as e:
+                print(f"Error closing Firebase app: {e}")
         
-        # Initialize Pyrebase for client-side authentication
-        firebase_config = self._get_firebase_config()
-        self.firebase = pyrebase.initialize_app(firebase_config)
+        self.db = connection["db"]
+        self.firebase = connection["firebase"]
         self.auth = self.firebase.auth()
+        return True
+
+    def ensure_connection(self):
+        """Reconnect if the shared connection fails its health check"""
+        if self.check_health():
+            return True
+        try:
+            return self.reconnect()
+        except Exception as e:
+            print(f"Error reconnecting to Firebase: {e}")
+            return False
 
     def _get_firebase_credentials(self):
         """Try multiple ways to get Firebase credentials"""
@@ -327,90 +449,603 @@ class FirebaseHandler:
             print(f"Error updating user Google ID: {e}")
             return False
 
-    def save_bill(self, username, date, category, amount, description):
-        try:
-            # Convert date to string if it's a datetime object
-            if isinstance(date, datetime):
-                date_str = date.strftime('%Y-%m-%d')
-            elif hasattr(date, 'strftime'):
-                date_str = date.strftime('%Y-%m-%d')
-            else:
-                date_str = str(date)
-            
-            bill_data = {
-                "username": username,
-                "date": date_str,
-                "category": category,
-                "amount": float(amount),
-                "description": description or "",
-                "created_at": datetime.now(),
-                "updated_at": datetime.now()
-            }
-            
-            # Add bill to Firestore
-            doc_ref = self.db.collection('bills').add(bill_data)
-            #print(f"Bill saved with ID: {doc_ref[1].id}")
-            return True
+    def _bill_data(self, username, date, category, amount, description):
+        """Build the Firestore document for a new bill"""
+        # Convert date to string if it's a datetime object
+        if isinstance(date, datetime):
+            date_str = date.strftime('%Y-%m-%d')
+        elif hasattr(date, 'strftime'):
+            date_str = date.strftime('%Y-%m-%d')
+        else:
+            date_str = str(date)
+        
+        return {
+            "username": username,
+            "date": date_str,
+            "category": category,
+            "amount": float(amount),
+            "description": description or "",
+            # Server timestamps keep updated_at monotonic across app
+            # processes, which incremental sync relies on
+            "created_at": firestore.SERVER_TIMESTAMP,
+            "updated_at": firestore.SERVER_TIMESTAMP
+        }
+
+    @staticmethod
+    def _cached_bill(bill_data, bill_id):
+        """Local copy of a just-written bill, with server timestamps resolved"""
+        now = datetime.now()
+        return {**bill_data, "created_at": now, "updated_at": now, "id": bill_id}
+
+    def save_bill(self, username, date, category, amount, description, receipt_hash=None, allow_duplicate=False):
+        # Bill, dedup key and monthly rollup go out in one atomic commit
+        result = self.save_bills_batch(username, [{
+            "date": date,
+            "category": category,
+            "amount": amount,
+            "description": description,
+            "receipt_hash": receipt_hash
+        }], allow_duplicates=allow_duplicate)[0]
+        
+        if result["duplicate"]:
+            print(f"Skipped duplicate bill; already saved as {result['id']}")
+        return result["ok"]
+
+    @staticmethod
+    def _dedup_base(username, bill_data, receipt_hash=None):
+        """The fields that make two bills the same expense"""
+        description = " ".join(str(bill_data.get("description") or "").lower().split())
+        amount = f"{float(bill_data.get('amount') or 0):.2f}"
+        return (username, str(bill_data.get("date") or ""), amount, description, receipt_hash or "")
+
+    @staticmethod
+    def _dedup_key(base, ordinal):
+        """Dedup index document id for the ordinal-th occurrence of a bill.
+        
+        The ordinal lets one receipt hold the same item twice, and lets a
+        user knowingly save a repeat expense, without colliding.
+        """
+        return hashlib.sha256("\x1f".join(base + (str(ordinal),)).encode("utf-8")).hexdigest()
+
+    def _existing_bill_keys(self, key_ids):
+        """Map each already indexed key id to its key document"""
+        keys_ref = self.db.collection('bill_keys')
+        existing = {}
+        for i in range(0, len(key_ids), BATCH_WRITE_LIMIT):
+            refs = [keys_ref.document(key_id) for key_id in key_ids[i:i + BATCH_WRITE_LIMIT]]
+            for doc in self.db.get_all(refs):
+                if doc.exists:
+                    existing[doc.id] = doc.to_dict()
+        return existing
+
+    def _assign_dedup_keys(self, pending, results):
+        """Give each pending bill a free dedup key, dropping known duplicates.
+        
+        pending holds (index, bill_data, base, allow_duplicate). Duplicates are
+        marked in results, or with allow_duplicate moved to the next free
+        ordinal. Returns the (index, bill_data) pairs to write.
+        """
+        next_ordinal = {}
+        candidates = []
+        for i, bill_data, base, allow_duplicate in pending:
+            ordinal = next_ordinal.get(base, 0)
+            next_ordinal[base] = ordinal + 1
+            candidates.append((i, bill_data, base, allow_duplicate, ordinal))
+        
+        accepted = []
+        while candidates:
+            key_ids = [self._dedup_key(base, ordinal) for _, _, base, _, ordinal in candidates]
+            existing = self._existing_bill_keys(key_ids)
             
+            retry = []
+            for (i, bill_data, base, allow_duplicate, ordinal), key_id in zip(candidates, key_ids):
+                if key_id not in existing:
+                    bill_data["dedup_key"] = key_id
+                    accepted.append((i, bill_data))
+                elif allow_duplicate:
+                    retry.append((i, bill_data, base, allow_duplicate, next_ordinal[base]))
+                    next_ordinal[base] += 1
+                else:
+                    results[i]["duplicate"] = True
+                    results[i]["id"] = existing[key_id].get("bill_id")
+            candidates = retry
+        
+        return sorted(accepted, key=lambda pair: pair[0])
+
+    def find_duplicate(self, username, date, amount, description, receipt_hash=None):
+        """Id of an already saved bill for the same expense, or None"""
+        try:
+            bill_data = self._bill_data(username, date, None, amount, description)
+            key_id = self._dedup_key(self._dedup_base(username, bill_data, receipt_hash), 0)
+            doc = self.db.collection('bill_keys').document(key_id).get()
+            return doc.to_dict().get('bill_id') if doc.exists else None
         except Exception as e:
-            print(f"Error saving bill: {e}")
-            return False
+            print(f"Error checking for duplicate bill: {e}")
+            return None
+
+    def save_bills_batch(self, username, bills, allow_duplicates=False):
+        """Save many bills in as few atomic WriteBatch commits as possible.
+        
+        Each bill is a dict with date, category, amount, description and
+        optional receipt_hash and allow_duplicate. Bills whose dedup key is
+        already indexed are skipped and reported as duplicates of the existing
+        bill, unless allow_duplicates or the bill's own allow_duplicate is set.
+        Returns one result per input bill: {"index", "id", "ok", "duplicate", "error"}.
+        """
+        results = [
+            {"index": i, "id": None, "ok": False, "duplicate": False, "error": None}
+            for i in range(len(bills))
+        ]
+        
+        pending = []
+        for i, bill in enumerate(bills):
+            try:
+                bill_data = self._bill_data(
+                    username,
+                    bill.get("date"),
+                    bill.get("category"),
+                    bill.get("amount", 0),
+                    bill.get("description")
+                )
+                receipt_hash = bill.get("receipt_hash")
+                if receipt_hash:
+                    bill_data["receipt_hash"] = receipt_hash
+                pending.append((
+                    i,
+                    bill_data,
+                    self._dedup_base(username, bill_data, receipt_hash),
+                    allow_duplicates or bool(bill.get("allow_duplicate"))
+                ))
+            except Exception as e:
+                results[i]["error"] = f"Invalid bill: {e}"
+        
+        try:
+            # One batched read of the dedup index for the whole save
+            pending = self._assign_dedup_keys(pending, results)
+        except Exception as e:
+            print(f"Error checking bill dedup index: {e}")
+            for i, _, _, _ in pending:
+                results[i]["error"] = str(e)
+            return results
+        
+        # Each chunk holds its bills and their dedup keys plus one rollup
+        # write per month touched
+        chunks = []
+        chunk, months = [], set()
+        for i, bill_data in pending:
+            month = bill_data["date"][:7]
+            extra_ops = 2 + (month not in months)
+            if chunk and 2 * len(chunk) + len(months) + extra_ops > BATCH_WRITE_LIMIT:
+                chunks.append(chunk)
+                chunk, months = [], set()
+            chunk.append((i, bill_data))
+            months.add(month)
+        if chunk:
+            chunks.append(chunk)
+        
+        bills_ref = self.db.collection('bills')
+        keys_ref = self.db.collection('bill_keys')
+        for chunk in chunks:
+            try:
+                batch = self.db.batch()
+                written = []
+                for i, bill_data in chunk:
+                    doc_ref = bills_ref.document()
+                    batch.set(doc_ref, bill_data)
+                    # create() fails the whole commit if a concurrent save took the key
+                    batch.create(keys_ref.document(bill_data["dedup_key"]), {
+                        "username": username,
+                        "bill_id": doc_ref.id,
+                        "created_at": firestore.SERVER_TIMESTAMP
+                    })
+                    written.append((i, bill_data, doc_ref.id))
+                self._write_rollup_deltas(
+                    batch, username, self._rollup_deltas([bill_data for _, bill_data in chunk])
+                )
+                batch.commit()
+                
+                for i, _, bill_id in written:
+                    results[i]["id"] = bill_id
+                    results[i]["ok"] = True
+                _bills_cache.add_bills(username, [
+                    self._cached_bill(bill_data, bill_id) for _, bill_data, bill_id in written
+                ])
+            except Exception as e:
+                print(f"Error saving bill batch: {e}")
+                for i, _ in chunk:
+                    results[i]["error"] = str(e)
+        
+        return results
 
     def get_bills(self, username):
+        return self.get_bills_with_version(username)[0]
+
+    def get_bills_with_version(self, username):
+        """Return (bills_df, data_version) for a user.
+        
+        The version changes whenever the user's bills do; it is None when
+        the bills could not be loaded into the cache.
+        """
+        cached = _bills_cache.get_with_version(username)
+        if cached is not None:
+            return cached
+        
         try:
-            # Use simpler query to avoid index requirements initially
-            bills_ref = self.db.collection('bills')
-            query = bills_ref.where(filter=FieldFilter('username', '==', username))
-            docs = query.stream()
-            
-            bills = []
-            for doc in docs:
-                bill_data = doc.to_dict()
-                bill_data['id'] = doc.id
-                bills.append(bill_data)
-            
-            if bills:
-                df = pd.DataFrame(bills)
-                # Sort by date in Python instead of Firestore to avoid index requirement
-                if 'date' in df.columns:
-                    df['date'] = df['date'].astype(str)
-                    df = df.sort_values('date', ascending=False)
-                return df
+            sync_state = _bills_cache.get_sync_state(username)
+            if self._can_sync_incrementally(sync_state):
+                try:
+                    self._sync_bills(username, sync_state["watermarks"])
+                except Exception as e:
+                    # e.g. the (username, updated_at) index is still building
+                    print(f"Incremental bills sync failed, reloading all bills: {e}")
+                    self._load_all_bills(username)
+            else:
+                self._load_all_bills(username)
             
-            return pd.DataFrame()
+            cached = _bills_cache.get_with_version(username)
+            if cached is not None:
+                return cached
             
         except Exception as e:
             print(f"Error getting bills: {e}")
-            return pd.DataFrame()
+            # Rebuild a dead connection so the next load can succeed
+            self.ensure_connection()
+        
+        # A stale snapshot beats showing the user no bills at all
+        stale = _bills_cache.get_with_version(username, allow_expired=True)
+        return stale if stale is not None else (empty_bills_frame(), None)
+
+    def query_bills(self, username, category=None, date_from=None, date_to=None, limit=50, cursor=None):
+        """Fetch one page of a user's bills, newest first, filtered in Firestore.
+        
+        Returns (bills_df, next_cursor); next_cursor is None on the last page.
+        Query errors, such as a composite index that is not deployed yet,
+        are raised so they are not mistaken for an empty history.
+        """
+        query = self.db.collection('bills').where(filter=FieldFilter('username', '==', username))
+        if category:
+            query = query.where(filter=FieldFilter('category', '==', category))
+        if date_from:
+            query = query.where(filter=FieldFilter('date', '>=', self._date_key(date_from)))
+        if date_to:
+            query = query.where(filter=FieldFilter('date', '<=', self._date_key(date_to)))
+        
+        query = (
+            query
+            .order_by('date', direction=firestore.Query.DESCENDING)
+            .order_by(FieldPath.document_id(), direction=firestore.Query.DESCENDING)
+        )
+        if cursor:
+            cursor_date, cursor_id = cursor.split('|', 1)
+            query = query.start_after({
+                'date': cursor_date,
+                FieldPath.document_id(): self.db.collection('bills').document(cursor_id)
+            })
+        
+        # Read one extra document to know whether another page exists
+        bills = []
+        for doc in query.limit(limit + 1).stream():
+            bill_data = doc.to_dict()
+            bill_data['id'] = doc.id
+            bills.append(bill_data)
+        
+        next_cursor = None
+        if len(bills) > limit:
+            bills = bills[:limit]
+            next_cursor = f"{bills[-1]['date']}|{bills[-1]['id']}"
+        
+        return self._bills_frame(bills), next_cursor
+
+    @staticmethod
+    def _date_key(value):
+        """Format a date the way bills store it, so string ranges sort correctly"""
+        if hasattr(value, 'strftime'):
+            return value.strftime('%Y-%m-%d')
+        return str(value)
+
+    def _can_sync_incrementally(self, sync_state):
+        """Only sync from a snapshot that has watermarks and is recent enough"""
+        if not sync_state or not sync_state["watermarks"].get("bills"):
+            return False
+        age = time.monotonic() - sync_state["full_loaded_at"]
+        return age < BILLS_FULL_RESYNC_SECONDS
+
+    def _bills_frame(self, bills):
+        """Build the typed bills DataFrame returned to pages"""
+        return build_bills_frame(bills)
 
-    def delete_bill(self, bill_id):
+    def _load_all_bills(self, username):
+        """Full scan of a user's bills, recording the watermarks for later syncs"""
+        bills_ref = self.db.collection('bills')
+        query = bills_ref.where(filter=FieldFilter('username', '==', username))
+        
+        bills = []
+        for doc in query.stream():
+            bill_data = doc.to_dict()
+            bill_data['id'] = doc.id
+            bills.append(bill_data)
+        
+        try:
+            # Tombstones written before this load are already reflected in it
+            latest_tombstone = self._latest_tombstone(username)
+        except Exception as e:
+            # Without the (username, deleted_at) index, syncs re-read every
+            # retained tombstone of the user instead; removing those is a no-op
+            print(f"Error reading latest tombstone: {e}")
+            latest_tombstone = None
+        
+        watermarks = {
+            "bills": self._max_timestamp(bills, 'updated_at'),
+            "tombstones": latest_tombstone
+        }
+        _bills_cache.put(username, self._bills_frame(bills), watermarks)
+
+    def _sync_bills(self, username, watermarks):
+        """Fetch only bills changed or deleted since the snapshot's watermarks"""
+        overlap = timedelta(seconds=BILLS_SYNC_OVERLAP_SECONDS)
+        
+        bills_since = watermarks["bills"] - overlap
+        query = (
+            self.db.collection('bills')
+            .where(filter=FieldFilter('username', '==', username))
+            .where(filter=FieldFilter('updated_at', '>', bills_since))
+        )
+        changed = []
+        for doc in query.stream():
+            bill_data = doc.to_dict()
+            bill_data['id'] = doc.id
+            changed.append(bill_data)
+        
+        deleted_ids = []
+        tombstones = []
+        tombstones_ref = self.db.collection('bill_tombstones')
+        tombstone_query = tombstones_ref.where(filter=FieldFilter('username', '==', username))
+        if watermarks.get("tombstones"):
+            tombstones_since = watermarks["tombstones"] - overlap
+            tombstone_query = tombstone_query.where(filter=FieldFilter('deleted_at', '>', tombstones_since))
+        for doc in tombstone_query.stream():
+            tombstone = doc.to_dict()
+            deleted_ids.append(tombstone.get('bill_id', doc.id))
+            tombstones.append(tombstone)
+        
+        new_watermarks = {
+            "bills": self._max_timestamp(changed, 'updated_at') or watermarks["bills"],
+            "tombstones": self._max_timestamp(tombstones, 'deleted_at') or watermarks.get("tombstones")
+        }
+        _bills_cache.apply_changes(username, self._bills_frame(changed), deleted_ids, new_watermarks)
+
+    def _latest_tombstone(self, username):
+        tombstones_ref = self.db.collection('bill_tombstones')
+        query = (
+            tombstones_ref
+            .where(filter=FieldFilter('username', '==', username))
+            .order_by('deleted_at', direction=firestore.Query.DESCENDING)
+            .limit(1)
+        )
+        for doc in query.stream():
+            return doc.to_dict().get('deleted_at')
+        return None
+
+    @staticmethod
+    def _max_timestamp(records, field):
+        timestamps = [r[field] for r in records if isinstance(r.get(field), datetime)]
+        return max(timestamps) if timestamps else None
+
+    def delete_bill(self, bill_id, username=None):
         try:
-            self.db.collection('bills').document(bill_id).delete()
+            bill_ref = self.db.collection('bills').document(bill_id)
+            tombstone_ref = self.db.collection('bill_tombstones').document(bill_id)
+            
+            @firestore.transactional
+            def delete_in_transaction(transaction):
+                bill_doc = bill_ref.get(transaction=transaction)
+                if not bill_doc.exists:
+                    return None
+                
+                # Delete, record a tombstone for incremental syncs and
+                # decrement the monthly rollup in the same transaction
+                bill = bill_doc.to_dict()
+                owner = bill.get('username')
+                transaction.delete(bill_ref)
+                transaction.set(tombstone_ref, {
+                    "username": owner,
+                    "bill_id": bill_id,
+                    "deleted_at": firestore.SERVER_TIMESTAMP
+                })
+                if bill.get('dedup_key'):
+                    # Free the key so the same expense can be saved again
+                    transaction.delete(self.db.collection('bill_keys').document(bill['dedup_key']))
+                self._write_rollup_deltas(transaction, owner, self._rollup_deltas([bill], sign=-1))
+                return owner
+            
+            owner = delete_in_transaction(self.db.transaction())
+            _bills_cache.remove_bills([bill_id], owner or username)
             return True
         except Exception as e:
             print(f"Error deleting bill: {e}")
             return False
 
-    def get_monthly_summary(self, username):
-        try:
-            bills_ref = self.db.collection('bills')
-            query = bills_ref.where(filter=FieldFilter('username', '==', username))
-            docs = query.stream()
+    def delete_bills_batch(self, bill_ids, username=None):
+        """Delete many bills in concurrent transactional chunks.
+        
+        Returns a dict mapping each bill id to whether it was deleted.
+        """
+        bill_ids = list(dict.fromkeys(bill_ids))
+        chunks = [
+            bill_ids[i:i + BULK_DELETE_CHUNK_SIZE]
+            for i in range(0, len(bill_ids), BULK_DELETE_CHUNK_SIZE)
+        ]
+        
+        results = {}
+        if not chunks:
+            return results
+        
+        with ThreadPoolExecutor(max_workers=min(BULK_DELETE_WORKERS, len(chunks))) as executor:
+            for chunk, outcome in zip(chunks, executor.map(self._delete_bill_chunk, chunks)):
+                ok, owners = outcome
+                for bill_id in chunk:
+                    results[bill_id] = ok
+                if ok:
+                    for owner, deleted_ids in owners.items():
+                        _bills_cache.remove_bills(deleted_ids, owner or username)
+        
+        return results
+
+    def _delete_bill_chunk(self, bill_ids):
+        """Delete one chunk of bills with their tombstones and rollup decrements.
+        
+        BULK_DELETE_CHUNK_SIZE keeps the chunk's writes within BATCH_WRITE_LIMIT
+        even when every bill falls in a different (owner, month) rollup.
+        """
+        bills_ref = self.db.collection('bills')
+        tombstones_ref = self.db.collection('bill_tombstones')
+        keys_ref = self.db.collection('bill_keys')
+        refs = [bills_ref.document(bill_id) for bill_id in bill_ids]
+        
+        @firestore.transactional
+        def delete_in_transaction(transaction):
+            bills_by_owner = {}
+            for bill_doc in transaction.get_all(refs):
+                if not bill_doc.exists:
+                    continue
+                bill = bill_doc.to_dict()
+                bill['id'] = bill_doc.id
+                bills_by_owner.setdefault(bill.get('username'), []).append(bill)
             
-            bills = []
-            for doc in docs:
-                bill_data = doc.to_dict()
-                bills.append(bill_data)
+            for owner, owner_bills in bills_by_owner.items():
+                for bill in owner_bills:
+                    transaction.delete(bills_ref.document(bill['id']))
+                    transaction.set(tombstones_ref.document(bill['id']), {
+                        "username": owner,
+                        "bill_id": bill['id'],
+                        "deleted_at": firestore.SERVER_TIMESTAMP
+                    })
+                    if bill.get('dedup_key'):
+                        transaction.delete(keys_ref.document(bill['dedup_key']))
+                if owner:
+                    self._write_rollup_deltas(transaction, owner, self._rollup_deltas(owner_bills, sign=-1))
             
-            if bills:
-                df = pd.DataFrame(bills)
-                df['date'] = pd.to_datetime(df['date'])
-                df['month'] = df['date'].dt.strftime('%Y-%m')
-                monthly_summary = df.groupby('month')['amount'].sum().reset_index()
-                monthly_summary.columns = ['month', 'total_amount']
-                return monthly_summary
+            return {owner: [bill['id'] for bill in owner_bills] for owner, owner_bills in bills_by_owner.items()}
+        
+        try:
+            return True, delete_in_transaction(self.db.transaction())
+        except Exception as e:
+            print(f"Error deleting bill batch: {e}")
+            return False, {}
+
+    def prune_tombstones(self, older_than_days=None):
+        """Delete tombstones older than any snapshot could still need"""
+        try:
+            days = older_than_days or BILLS_TOMBSTONE_RETENTION_DAYS
+            cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+            query = self.db.collection('bill_tombstones').where(
+                filter=FieldFilter('deleted_at', '<', cutoff)
+            )
             
-            return pd.DataFrame()
+            pruned = 0
+            batch = self.db.batch()
+            for doc in query.stream():
+                batch.delete(doc.reference)
+                pruned += 1
+                if pruned % 500 == 0:
+                    batch.commit()
+                    batch = self.db.batch()
+            batch.commit()
+            return pruned
+        except Exception as e:
+            print(f"Error pruning tombstones: {e}")
+            return 0
+
+    def find_duplicate_bills(self, username):
+        """Scan a user's whole history for bills that look like the same expense.
+        
+        Bills are grouped by date, amount and normalized description. Groups
+        made only of distinct items from a single receipt save are skipped.
+        Returns lists of bill dicts, oldest first within each group.
+        """
+        try:
+            return self._scan_duplicate_bills(username)
+        except Exception as e:
+            print(f"Error scanning for duplicate bills: {e}")
+            return []
+
+    def _scan_duplicate_bills(self, username):
+        query = self.db.collection('bills').where(filter=FieldFilter('username', '==', username))
+        groups = {}
+        for doc in query.stream():
+            bill = doc.to_dict()
+            bill['id'] = doc.id
+            groups.setdefault(self._dedup_base(username, bill), []).append(bill)
+        
+        duplicates = []
+        for group in groups.values():
+            if len(group) < 2:
+                continue
+            receipts = {bill.get('receipt_hash') for bill in group}
+            if len(receipts) == 1 and None not in receipts and all(bill.get('dedup_key') for bill in group):
+                continue
+            group.sort(key=lambda bill: str(bill.get('created_at') or ''))
+            duplicates.append(group)
+        return duplicates
+
+    def schedule_duplicate_scan(self, username):
+        """Rescan a user's history for duplicate bills in a background thread.
+        
+        The scan only runs when the stored report is older than
+        DUPLICATE_SCAN_INTERVAL_SECONDS, and each process checks at most
+        that often per user.
+        """
+        now = time.monotonic()
+        with _duplicate_scans_lock:
+            checked_at = _duplicate_scans_checked.get(username)
+            if checked_at is not None and now - checked_at < DUPLICATE_SCAN_INTERVAL_SECONDS:
+                return
+            _duplicate_scans_checked[username] = now
+        
+        def scan():
+            try:
+                report_ref = self.db.collection('bill_duplicate_scans').document(username)
+                report_doc = report_ref.get()
+                scanned_at = report_doc.to_dict().get('scanned_at') if report_doc.exists else None
+                if scanned_at and datetime.now(timezone.utc) - scanned_at < timedelta(seconds=DUPLICATE_SCAN_INTERVAL_SECONDS):
+                    return
+                
+                groups = self._scan_duplicate_bills(username)
+                report_ref.set({
+                    "username": username,
+                    # Firestore has no nested arrays, so each group is a map
+                    "groups": [{"bill_ids": [bill['id'] for bill in group]} for group in groups],
+                    "duplicate_bills": sum(len(group) - 1 for group in groups),
+                    "scanned_at": firestore.SERVER_TIMESTAMP
+                })
+            except Exception as e:
+                print(f"Error in background duplicate scan for {username}: {e}")
+                # Try again on the next check instead of waiting a full interval
+                with _duplicate_scans_lock:
+                    _duplicate_scans_checked.pop(username, None)
+        
+        threading.Thread(target=scan, name=f"duplicate-scan-{username}", daemon=True).start()
+
+    def get_duplicate_report(self, username):
+        """The latest background duplicate scan of a user, or None if none has finished"""
+        try:
+            report_doc = self.db.collection('bill_duplicate_scans').document(username).get()
+            return report_doc.to_dict() if report_doc.exists else None
+        except Exception as e:
+            print(f"Error reading duplicate report: {e}")
+            return None
+
+    def get_monthly_summary(self, username):
+        try:
+            # One read of the monthly rollups instead of a query per month
+            rows = [
+                {"month": rollup.get('month'), "total_amount": float(rollup.get('total') or 0.0)}
+                for rollup in self.get_rollups(username)
+                if int(rollup.get('count') or 0) > 0
+            ]
+            if not rows:
+                return pd.DataFrame()
+            return pd.DataFrame(rows, columns=['month', 'total_amount']).sort_values('month', ignore_index=True)
             
         except Exception as e:
             print(f"Error getting monthly summary: {e}")
@@ -418,27 +1053,224 @@ class FirebaseHandler:
 
     def get_category_summary(self, username):
         try:
-            bills_ref = self.db.collection('bills')
-            query = bills_ref.where(filter=FieldFilter('username', '==', username))
-            docs = query.stream()
+            # The monthly rollups keep totals for every category actually
+            # stored, including ones outside EXPENSE_CATEGORIES
+            totals = {}
+            counts = {}
+            for rollup in self.get_rollups(username):
+                for category, amount in (rollup.get('categories') or {}).items():
+                    totals[category] = totals.get(category, 0.0) + float(amount or 0.0)
+                for category, count in (rollup.get('category_counts') or {}).items():
+                    counts[category] = counts.get(category, 0) + int(count or 0)
             
-            bills = []
-            for doc in docs:
-                bill_data = doc.to_dict()
-                bills.append(bill_data)
-            
-            if bills:
-                df = pd.DataFrame(bills)
-                category_summary = df.groupby('category')['amount'].sum().reset_index()
-                category_summary.columns = ['category', 'total_amount']
-                return category_summary
-            
-            return pd.DataFrame()
+            observed = [category for category, count in counts.items() if count > 0]
+            rows = [
+                {"category": category, "total_amount": totals.get(category, 0.0)}
+                for category in self._order_categories(observed)
+            ]
+            if not rows:
+                return pd.DataFrame()
+            return pd.DataFrame(rows, columns=['category', 'total_amount'])
             
         except Exception as e:
             print(f"Error getting category summary: {e}")
             return pd.DataFrame()
 
+    @staticmethod
+    def _order_categories(categories):
+        """Known categories in their configured order, then any others alphabetically"""
+        categories = set(categories)
+        return (
+            [category for category in EXPENSE_CATEGORIES if category in categories]
+            + sorted(categories - set(EXPENSE_CATEGORIES))
+        )
+
+    def get_categories(self, username):
+        """Categories the user has bills in, read from the monthly rollups"""
+        try:
+            observed = set()
+            for rollup in self.get_rollups(username):
+                observed.update(
+                    category for category, count in (rollup.get('category_counts') or {}).items()
+                    if int(count or 0) > 0
+                )
+            return self._order_categories(observed)
+        except Exception as e:
+            print(f"Error getting categories: {e}")
+            return list(EXPENSE_CATEGORIES)
+
+    @staticmethod
+    def _rollup_deltas(bills, sign=1):
+        """Group bills into per-month count/total/category deltas"""
+        deltas = {}
+        for bill in bills:
+            month = str(bill.get('date', ''))[:7]
+            if not month:
+                continue
+            
+            amount = float(bill.get('amount') or 0.0) * sign
+            category = bill.get('category') or EXPENSE_CATEGORIES[-1]
+            delta = deltas.setdefault(month, {
+                "count": 0,
+                "total": 0.0,
+                "categories": {},
+                "category_counts": {}
+            })
+            delta["count"] += sign
+            delta["total"] += amount
+            delta["categories"][category] = delta["categories"].get(category, 0.0) + amount
+            delta["category_counts"][category] = delta["category_counts"].get(category, 0) + sign
+        return deltas
+
+    def _rollup_ref(self, username, month):
+        return self.db.collection('bill_rollups').document(f"{username}_{month}")
+
+    def _write_rollup_deltas(self, writer, username, deltas):
+        """Apply rollup deltas as increments through a batch or transaction"""
+        for month, delta in deltas.items():
+            writer.set(self._rollup_ref(username, month), {
+                "username": username,
+                "month": month,
+                "count": firestore.Increment(delta["count"]),
+                "total": firestore.Increment(delta["total"]),
+                "categories": {
+                    category: firestore.Increment(amount)
+                    for category, amount in delta["categories"].items()
+                },
+                "category_counts": {
+                    category: firestore.Increment(count)
+                    for category, count in delta["category_counts"].items()
+                },
+                "updated_at": firestore.SERVER_TIMESTAMP
+            }, merge=True)
+
+    def rebuild_rollups(self, username):
+        """Recompute a user's monthly rollups from their raw bills.
+        
+        Each month is rebuilt in its own transaction, so saves and deletes
+        running meanwhile are never lost (see _rebuild_month_rollup).
+        """
+        try:
+            bills_query = self.db.collection('bills').where(filter=FieldFilter('username', '==', username))
+            # Months with bills now, plus months that only have a (possibly stale) rollup
+            months = {str(doc.to_dict().get('date', ''))[:7] for doc in bills_query.select(['date']).stream()}
+            rollups_ref = self.db.collection('bill_rollups')
+            for doc in rollups_ref.where(filter=FieldFilter('username', '==', username)).stream():
+                months.add(doc.to_dict().get('month'))
+            months.discard('')
+            months.discard(None)
+            
+            bill_count = 0
+            month_count = 0
+            for month in sorted(months):
+                count = self._rebuild_month_rollup(username, bills_query, month)
+                bill_count += count
+                month_count += count > 0
+            
+            # Only marked once every month has been rebuilt
+            self.db.collection('bill_rollup_state').document(username).set({
+                "username": username,
+                "months": month_count,
+                "bills": bill_count,
+                "rebuilt_at": firestore.SERVER_TIMESTAMP
+            })
+            
+            _rollups_ready.add(username)
+            return True
+        except Exception as e:
+            print(f"Error rebuilding rollups: {e}")
+            return False
+
+    def _rebuild_month_rollup(self, username, bills_query, month):
+        """Rebuild one month's rollup from its bills, returning the bill count.
+        
+        The rollup is read before the month's bills. Saves and deletes write
+        that rollup in the same commit as the bills, so each one either
+        committed before the read and is counted here, or conflicts with the
+        transaction and applies its increment on top of the rebuilt value.
+        """
+        rollup_ref = self._rollup_ref(username, month)
+        month_query = (
+            bills_query
+            .where(filter=FieldFilter('date', '>=', month))
+            .where(filter=FieldFilter('date', '<', month + '\uf8ff'))
+        )
+        
+        @firestore.transactional
+        def rebuild_in_transaction(transaction):
+            rollup_ref.get(transaction=transaction)
+            bills = [doc.to_dict() for doc in transaction.get(month_query)]
+            delta = self._rollup_deltas(bills).get(month)
+            if delta is None:
+                transaction.delete(rollup_ref)
+                return 0
+            
+            transaction.set(rollup_ref, {
+                "username": username,
+                "month": month,
+                "updated_at": firestore.SERVER_TIMESTAMP,
+                **delta
+            })
+            return delta["count"]
+        
+        return rebuild_in_transaction(self.db.transaction())
+
+    def get_rollups(self, username):
+        """Return a user's monthly rollup documents, backfilling them on first use"""
+        if username not in _rollups_ready:
+            state_doc = self.db.collection('bill_rollup_state').document(username).get()
+            if state_doc.exists:
+                _rollups_ready.add(username)
+            elif not self.rebuild_rollups(username):
+                raise RuntimeError(f"Could not build rollups for {username}")
+        
+        # Same entry points as the rollup backfill, so every active user gets scanned
+        self.schedule_duplicate_scan(username)
+        
+        rollups_ref = self.db.collection('bill_rollups')
+        query = rollups_ref.where(filter=FieldFilter('username', '==', username))
+        return [doc.to_dict() for doc in query.stream()]
+
+    def get_bill_stats(self, username):
+        """Summary statistics for stats cards, read from the monthly rollups"""
+        rollups = self.get_rollups(username)
+        current_month = datetime.now().strftime('%Y-%m')
+        
+        total_bills = 0
+        total_spent = 0.0
+        this_month_total = 0.0
+        category_counts = {}
+        for rollup in rollups:
+            total_bills += int(rollup.get('count') or 0)
+            total_spent += float(rollup.get('total') or 0.0)
+            if rollup.get('month') == current_month:
+                this_month_total += float(rollup.get('total') or 0.0)
+            for category, count in (rollup.get('category_counts') or {}).items():
+                category_counts[category] = category_counts.get(category, 0) + int(count or 0)
+        
+        top_category = None
+        if any(count > 0 for count in category_counts.values()):
+            top_category = max(category_counts, key=category_counts.get)
+        
+        return {
+            "this_month_total": this_month_total,
+            "total_bills": total_bills,
+            "total_spent": total_spent,
+            "average_bill": total_spent / total_bills if total_bills else 0.0,
+            "top_category": top_category
+        }
+
+    def get_search_index(self, username):
+        """Description search index over the bills last returned by get_bills, or None if not cached"""
+        return _bills_cache.get_search_index(username)
+
+    def invalidate_bills_cache(self, username=None):
+        """Drop cached bills for one user, or for everyone when no user is given"""
+        if username:
+            _bills_cache.invalidate(username)
+        else:
+            _bills_cache.clear()
+
     def update_user(self, username, name, email, password=None):
         try:
             update_data = {
@@ -0,0 +1,100 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+class ExtractionCache:
+    """Size-bounded on-disk cache of Gemini receipt extractions.
+
+    Entries are keyed by a hash of the normalized image bytes plus everything
+    that affects the model output (prompt, model name, generation config).
+    The least recently read entries are evicted once the directory grows
+    past max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes=50 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._total_bytes = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(image_data, prompt, model, generation_config):
+        digest = hashlib.sha256()
+        digest.update(image_data)
+        for part in (prompt, model, json.dumps(generation_config, sort_keys=True, default=str)):
+            digest.update(b"\0")
+            digest.update(part.encode("utf-8"))
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, key):
+        """Return the cached entry for a key, or None"""
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            # Bump the modification time so eviction treats it as recently used
+            os.utime(path, None)
+            return entry
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f"Error reading extraction cache entry {key}: {e}")
+            return None
+
+    def put(self, key, entry):
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            data = json.dumps({**entry, "cached_at": time.time()}).encode("utf-8")
+
+            # Write atomically so concurrent readers never see a partial file
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            previous_size = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp_path, path)
+
+            with self._lock:
+                if self._total_bytes is None:
+                    self._total_bytes = self._scan_size()
+                else:
+                    self._total_bytes += len(data) - previous_size
+                if self._total_bytes > self.max_bytes:
+                    self._evict()
+        except OSError as e:
+            print(f"Error writing extraction cache entry {key}: {e}")
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".json"):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    yield path, stat.st_size, stat.st_mtime
+
+    def _scan_size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self):
+        # Trim to 90% of the budget so every put doesn't trigger another scan
+        target = int(self.max_bytes * 0.9)
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                continue
+        self._total_bytes = total
@@ -1,25 +1,269 @@
-from PIL import Image, UnidentifiedImageError
+from PIL import Image, ImageOps, UnidentifiedImageError
 import pillow_heif
 import io
+import multiprocessing
+import queue
+import threading
+from config import (
+    IMAGE_MAX_DIMENSION,
+    IMAGE_OUTPUT_FORMAT,
+    IMAGE_OUTPUT_QUALITY,
+    IMAGE_GRAYSCALE,
+    IMAGE_AUTOCONTRAST,
+    IMAGE_PASSTHROUGH_MAX_BYTES,
+    IMAGE_DECODE_WORKERS,
+    IMAGE_DECODE_TIMEOUT_SECONDS,
+    IMAGE_DECODE_INLINE_MAX_BYTES
+)
 
 # Enable HEIC support
 pillow_heif.register_heif_opener()
 
+OUTPUT_MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+JPEG_MAGIC = b"\xff\xd8\xff"
+EXIF_ORIENTATION_TAG = 0x0112
+# Enough to cover the JPEG markers up to the frame header, including EXIF
+HEADER_SNIFF_BYTES = 64 * 1024
+
+class DecodeWorkerDied(Exception):
+    """A decode worker exited (e.g. killed for memory) before returning a result"""
+
+def _decode_worker_main(conn):
+    """Decode worker loop: receive upload bytes, send back ("ok", bytes, mime_type) or ("error", exception)"""
+    conn.send("ready")
+    while True:
+        try:
+            data = conn.recv_bytes()
+        except EOFError:
+            return
+        try:
+            result = ("ok",) + _convert_in_worker(data)
+        except Exception as e:
+            result = ("error", e)
+        try:
+            conn.send(result)
+        except Exception as e:
+            # The exception itself may not pickle
+            conn.send(("error", RuntimeError(str(e))))
+
+class _DecodeWorker:
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_decode_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def stop(self):
+        self.process.terminate()
+        self.conn.close()
+
+class DecodePool:
+    """Fixed number of decode worker processes, each running one job at a time.
+
+    A job's timeout starts when a worker picks it up, not while it waits for
+    a free worker, and only the worker running a stuck or crashed job is
+    replaced, so other uploads in flight are unaffected.
+    """
+
+    def __init__(self, workers, timeout):
+        # spawn, not fork: the app process runs many threads
+        self._context = multiprocessing.get_context("spawn")
+        self._timeout = timeout
+        # Free worker slots; None is a slot whose process is not started yet
+        self._idle = queue.Queue()
+        for _ in range(workers):
+            self._idle.put(None)
+
+    def _start_worker(self):
+        worker = _DecodeWorker(self._context)
+        try:
+            # Wait for the imports in the new process, so they don't eat into the job's timeout
+            ready = worker.conn.poll(self._timeout) and worker.conn.recv() == "ready"
+        except (EOFError, OSError):
+            ready = False
+        if not ready:
+            worker.stop()
+            raise DecodeWorkerDied("Decode worker did not start")
+        return worker
+
+    def run(self, data):
+        """Convert upload bytes in a worker, returning (bytes, mime_type).
+
+        Raises TimeoutError if the job runs longer than the timeout and
+        DecodeWorkerDied if its worker exits.
+        """
+        worker = self._idle.get()
+        healthy = False
+        try:
+            if worker is not None and not worker.process.is_alive():
+                worker.stop()
+                worker = None
+            if worker is None:
+                worker = self._start_worker()
+            try:
+                worker.conn.send_bytes(data)
+                finished = worker.conn.poll(self._timeout)
+                if finished:
+                    status, *result = worker.conn.recv()
+            except (EOFError, OSError) as e:
+                raise DecodeWorkerDied(str(e) or "Decode worker exited")
+            if not finished:
+                raise TimeoutError("Image decode timed out")
+            healthy = True
+        finally:
+            if not healthy and worker is not None:
+                # Stuck on a pathological image or dead; only this worker is replaced
+                worker.stop()
+            self._idle.put(worker if healthy else None)
+
+        if status == "error":
+            raise result[0]
+        return result[0], result[1]
+
+# Process-wide decode pool, created on first use
+_decode_pool = None
+_decode_pool_lock = threading.Lock()
+
+def _get_decode_pool():
+    global _decode_pool
+    with _decode_pool_lock:
+        if _decode_pool is None:
+            _decode_pool = DecodePool(IMAGE_DECODE_WORKERS, IMAGE_DECODE_TIMEOUT_SECONDS)
+        return _decode_pool
+
+def _convert_in_worker(data):
+    """Decode worker entry point; returns (bytes, mime_type)"""
+    buffer, mime_type = ImageProcessor.convert_image_format(io.BytesIO(data))
+    return buffer.getvalue(), mime_type
+
 class ImageProcessor:
     @staticmethod
-    def convert_image_format(uploaded_file):
+    def prepare_receipt_image(image, max_dimension=IMAGE_MAX_DIMENSION,
+                              grayscale=IMAGE_GRAYSCALE, autocontrast=IMAGE_AUTOCONTRAST):
+        """Orient, downscale and optionally normalize a receipt image for OCR"""
+        if image.format == "JPEG":
+            # Let the decoder skip full-resolution work when we only need a smaller image
+            image.draft("RGB", (max_dimension, max_dimension))
+
+        # Phones store rotation in EXIF; apply it so text isn't sideways for the model
+        image = ImageOps.exif_transpose(image)
+
+        if max(image.size) > max_dimension:
+            image.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+
+        image = image.convert("L" if grayscale else "RGB")
+        if autocontrast:
+            # Faded thermal paper benefits from stretching the histogram
+            image = ImageOps.autocontrast(image, cutoff=1)
+        return image
+
+    @staticmethod
+    def encode_image(image, output_format=IMAGE_OUTPUT_FORMAT, quality=IMAGE_OUTPUT_QUALITY):
+        """Encode a prepared image, returning (buffer, mime_type)"""
+        output_format = output_format.upper()
+        if output_format not in OUTPUT_MIME_TYPES:
+            raise ValueError(f"Unsupported output format: {output_format}")
+
+        buffer = io.BytesIO()
+        if output_format == "JPEG":
+            image.save(buffer, format="JPEG", quality=quality, optimize=True)
+        else:
+            image.save(buffer, format="WEBP", quality=quality, method=4)
+        buffer.seek(0)
+        return buffer, OUTPUT_MIME_TYPES[output_format]
+
+    @staticmethod
+    def convert_image_format(uploaded_file, **options):
+        """Decode an upload and run it through the receipt preprocessing pipeline.
+
+        options override the IMAGE_* config (max_dimension, grayscale,
+        autocontrast, output_format, quality), e.g. for benchmarking.
+        """
+        encode_options = {key: options.pop(key) for key in ("output_format", "quality") if key in options}
         try:
             image = Image.open(uploaded_file)
-            buffer = io.BytesIO()
-            image = image.convert("RGB")
-            image.save(buffer, format="JPEG")
-            buffer.seek(0)
-            return buffer, "image/jpeg"
+            image = ImageProcessor.prepare_receipt_image(image, **options)
+            return ImageProcessor.encode_image(image, **encode_options)
         except UnidentifiedImageError:
             raise ValueError("Unsupported image format. Please upload PNG, JPEG, or HEIC images.")
 
     @staticmethod
-    def setup_input_image(uploaded_file):
-        converted_file, mime_type = ImageProcessor.convert_image_format(uploaded_file)
-        bytes_data = converted_file.getvalue()
-        return bytes_data, mime_type
\ No newline at end of file
+    def sniff_image(data):
+        """Read format, mode, size and EXIF orientation from the header without decoding pixels"""
+        try:
+            # Image.open is lazy, so only the header prefix is parsed
+            with Image.open(io.BytesIO(data[:HEADER_SNIFF_BYTES])) as image:
+                return {
+                    "format": image.format,
+                    "mode": image.mode,
+                    "size": image.size,
+                    "orientation": image.getexif().get(EXIF_ORIENTATION_TAG, 1)
+                }
+        except Exception:
+            # Unrecognized or header larger than the prefix; take the decode path
+            return None
+
+    @staticmethod
+    def can_pass_through(data):
+        """Whether an upload can be sent to Gemini as-is"""
+        if IMAGE_GRAYSCALE or IMAGE_AUTOCONTRAST:
+            return False
+        if len(data) > IMAGE_PASSTHROUGH_MAX_BYTES or bytes(data[:3]) != JPEG_MAGIC:
+            return False
+
+        header = ImageProcessor.sniff_image(data)
+        return (
+            header is not None
+            and header["format"] == "JPEG"
+            and header["mode"] == "RGB"
+            and max(header["size"]) <= IMAGE_MAX_DIMENSION
+            and header["orientation"] == 1
+        )
+
+    @staticmethod
+    def _upload_view(upload):
+        """Zero-copy view of an upload's bytes"""
+        if isinstance(upload, io.BytesIO):
+            # Streamlit's UploadedFile is a BytesIO too
+            return upload.getbuffer()
+        if isinstance(upload, (bytes, bytearray, memoryview)):
+            return memoryview(upload)
+        return memoryview(upload.read())
+
+    @staticmethod
+    def setup_input_image(upload):
+        """Return (image_data, mime_type) ready for Gemini.
+
+        upload is raw bytes, a memoryview or a file-like object. Compact
+        upright JPEGs skip decoding and re-encoding and come back as a view of
+        the upload's own buffer; everything else is decoded and re-encoded.
+        image_data is a memoryview either way. The Gemini request is the one
+        place it is copied, with bytes().
+        """
+        data = ImageProcessor._upload_view(upload)
+        if ImageProcessor.can_pass_through(data):
+            return data, "image/jpeg"
+
+        return ImageProcessor.convert_offloaded(data)
+
+    @staticmethod
+    def convert_offloaded(data):
+        """Run the decode pipeline, in the process pool unless the input is small"""
+        if IMAGE_DECODE_WORKERS <= 0 or len(data) <= IMAGE_DECODE_INLINE_MAX_BYTES:
+            converted_file, mime_type = ImageProcessor.convert_image_format(io.BytesIO(data))
+            return converted_file.getbuffer(), mime_type
+
+        payload = bytes(data)
+        pool = _get_decode_pool()
+        for attempt in range(2):
+            try:
+                image_data, mime_type = pool.run(payload)
+                return memoryview(image_data), mime_type
+            except TimeoutError:
+                raise ValueError("Image took too long to process. Please try a smaller image.")
+            except DecodeWorkerDied as e:
+                # A worker died (e.g. killed for memory); retry once on a fresh worker
+                print(f"Image decode worker failed: {e}")
+                if attempt:
+                    raise ValueError("Image processing failed. Please try again.")
@@ -22,6 +22,10 @@ apply_custom_css()
 # Initialize session state
 init_session_state()
 
+# Configure Gemini and open its connection before the first receipt upload
+from bill_processor import warm_up_gemini
+warm_up_gemini()
+
 # Import page modules
 from pages import auth, register, dashboard, upload, bills, analytics, profile
 
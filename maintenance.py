@@ -0,0 +1,86 @@
+"""Maintenance commands for Biller's derived Firestore data.
+
+Usage:
+    python maintenance.py rebuild-rollups alice bob
+    python maintenance.py rebuild-rollups --all
+    python maintenance.py prune-tombstones --days 30
+    python maintenance.py find-duplicates --all
+"""
+import argparse
+from dotenv import load_dotenv
+
+# Load environment variables before the database module reads credentials
+load_dotenv()
+
+from database import FirebaseHandler
+
+def get_all_usernames(db):
+    """List every username that has a profile document"""
+    return [doc.id for doc in db.db.collection('users').stream()]
+
+def rebuild_rollups(db, usernames):
+    failed = 0
+    for username in usernames:
+        if db.rebuild_rollups(username):
+            print(f"Rebuilt rollups for {username}")
+        else:
+            print(f"Failed to rebuild rollups for {username}")
+            failed += 1
+    return failed
+
+def find_duplicates(db, usernames):
+    found = 0
+    for username in usernames:
+        for group in db.find_duplicate_bills(username):
+            found += 1
+            first = group[0]
+            print(f"{username}: {len(group)} x {first.get('date')} €{float(first.get('amount') or 0):.2f} "
+                  f"'{first.get('description', '')}'")
+            for bill in group:
+                print(f"    {bill['id']}  created {bill.get('created_at')}  receipt {bill.get('receipt_hash') or '-'}")
+    print(f"Found {found} groups of duplicate bills")
+    return found
+
+def main():
+    parser = argparse.ArgumentParser(description="Biller maintenance commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    rollups_parser = subparsers.add_parser(
+        "rebuild-rollups",
+        help="Backfill or repair monthly rollup documents from raw bills"
+    )
+    rollups_parser.add_argument("usernames", nargs="*", help="Users to rebuild")
+    rollups_parser.add_argument("--all", action="store_true", help="Rebuild every user")
+
+    tombstones_parser = subparsers.add_parser(
+        "prune-tombstones",
+        help="Delete old bill tombstones used by incremental sync"
+    )
+    tombstones_parser.add_argument("--days", type=int, default=None, help="Retention in days")
+
+    duplicates_parser = subparsers.add_parser(
+        "find-duplicates",
+        help="Report bills that look like the same expense saved more than once"
+    )
+    duplicates_parser.add_argument("usernames", nargs="*", help="Users to scan")
+    duplicates_parser.add_argument("--all", action="store_true", help="Scan every user")
+
+    args = parser.parse_args()
+    db = FirebaseHandler()
+
+    if args.command in ("rebuild-rollups", "find-duplicates"):
+        usernames = get_all_usernames(db) if args.all else args.usernames
+        if not usernames:
+            parser.error("pass one or more usernames, or --all")
+        if args.command == "find-duplicates":
+            find_duplicates(db, usernames)
+            return 0
+        return 1 if rebuild_rollups(db, usernames) else 0
+
+    if args.command == "prune-tombstones":
+        pruned = db.prune_tombstones(args.days)
+        print(f"Pruned {pruned} tombstones")
+        return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,8 +1,8 @@
 import streamlit as st
-import pandas as pd
 import plotly.express as px
 from database import FirebaseHandler
-from ui_components import render_header
+from analytics_engine import get_analytics, resample_trend, TREND_RANGES
+from ui_components import render_header, render_expense_table
 
 def main():
     """Main function for analytics page"""
@@ -15,33 +15,33 @@ def analytics_page():
     try:
         username = st.session_state["username"]
         db = FirebaseHandler()
-        bills_df = db.get_bills(username)
+        bills_df, version = db.get_bills_with_version(username)
         
         if not bills_df.empty:
-            bills_df['date'] = pd.to_datetime(bills_df['date'])
-            bills_df['month'] = bills_df['date'].dt.strftime('%Y-%m')
+            # Every view comes from one pass, reused until the bills change
+            views = get_analytics(username, bills_df, version)
             
             # Create visualizations
             col1, col2 = st.columns(2)
             
             with col1:
-                render_monthly_chart(bills_df)
+                render_monthly_chart(views['monthly'])
             
             with col2:
-                render_category_chart(bills_df)
+                render_category_chart(views['category'])
             
             # Spending trends
             st.markdown("### 📈 Spending Trends")
-            render_spending_trends(bills_df)
+            render_spending_trends(views['daily'])
             
             # Additional insights
             col1, col2 = st.columns(2)
             
             with col1:
-                render_weekly_pattern(bills_df)
+                render_weekly_pattern(views['weekly'])
             
             with col2:
-                render_top_expenses(bills_df)
+                render_top_expenses(views['top_expenses'])
             
         else:
             st.info("📊 No data available for analytics. Add some bills first!")
@@ -50,11 +50,8 @@ def analytics_page():
         st.error(f"Error loading analytics: {str(e)}")
 
 @st.fragment
-def render_monthly_chart(df):
+def render_monthly_chart(monthly_data):
     """Render monthly spending chart"""
-    monthly_data = df.groupby('month')['amount'].sum().reset_index()
-    monthly_data = monthly_data.sort_values('month').tail(12)  # Last 12 months
-    
     fig = px.bar(
         monthly_data,
         x='month',
@@ -74,10 +71,8 @@ def render_monthly_chart(df):
     st.plotly_chart(fig, use_container_width=True)
 
 @st.fragment
-def render_category_chart(df):
+def render_category_chart(category_data):
     """Render category breakdown chart"""
-    category_data = df.groupby('category')['amount'].sum().reset_index()
-    
     fig = px.pie(
         category_data,
         values='amount',
@@ -89,16 +84,27 @@ def render_category_chart(df):
     st.plotly_chart(fig, use_container_width=True)
 
 @st.fragment
-def render_spending_trends(df):
-    """Render daily spending trends"""
-    daily_spending = df.groupby(df['date'].dt.date)['amount'].sum().reset_index()
-    daily_spending.columns = ['date', 'amount']
+def render_spending_trends(daily_spending):
+    """Render spending trends, bucketed so the chart stays small for long histories"""
+    range_label = st.radio(
+        "Range",
+        options=list(TREND_RANGES),
+        index=len(TREND_RANGES) - 1,
+        horizontal=True,
+        label_visibility="collapsed",
+        key="trend_range"
+    )
+    trend, resolution = resample_trend(daily_spending, TREND_RANGES[range_label])
+    
+    if trend.empty:
+        st.info("No spending in this period.")
+        return
     
     fig = px.line(
-        daily_spending,
+        trend,
         x='date',
         y='amount',
-        title='Daily Spending Trend'
+        title=f'{resolution} Spending Trend'
     )
     
     fig.update_layout(
@@ -110,14 +116,8 @@ def render_spending_trends(df):
     st.plotly_chart(fig, use_container_width=True)
 
 @st.fragment
-def render_weekly_pattern(df):
+def render_weekly_pattern(weekly_data):
     """Render weekly spending pattern"""
-    df['day_of_week'] = df['date'].dt.day_name()
-    day_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-    
-    weekly_data = df.groupby('day_of_week')['amount'].mean().reindex(day_order).reset_index()
-    weekly_data.columns = ['day', 'avg_amount']
-    
     fig = px.bar(
         weekly_data,
         x='day',
@@ -137,26 +137,7 @@ def render_weekly_pattern(df):
     st.plotly_chart(fig, use_container_width=True)
 
 @st.fragment
-def render_top_expenses(df):
+def render_top_expenses(top_expenses):
     """Render top expenses"""
-    top_expenses = df.nlargest(10, 'amount')[['description', 'amount', 'date', 'category']]
-    
     st.markdown("### 💸 Top 10 Expenses")
-    
-    for idx, expense in top_expenses.iterrows():
-        with st.container():
-            col1, col2, col3, col4 = st.columns([3, 1, 1, 1])
-            
-            with col1:
-                st.write(f"**{expense['description'][:40]}{'...' if len(expense['description']) > 40 else ''}**")
-            
-            with col2:
-                st.write(f"€{expense['amount']:.2f}")
-            
-            with col3:
-                st.write(expense['category'].title())
-            
-            with col4:
-                st.write(expense['date'].strftime('%Y-%m-%d'))
-            
-            st.markdown("---")
\ No newline at end of file
+    render_expense_table(top_expenses)
\ No newline at end of file
@@ -3,7 +3,9 @@ import pandas as pd
 from datetime import datetime, timedelta
 import time
 from database import FirebaseHandler
+from receipt_store import get_receipt_store
 from ui_components import render_header, create_success_message
+from config import BILLS_PAGE_SIZE
 
 def main():
     """Main function for bills page"""
@@ -16,121 +18,182 @@ def bills_page():
     try:
         username = st.session_state["username"]
         db = FirebaseHandler()
-        bills_df = db.get_bills(username)
         
-        if not bills_df.empty:
-            # Add filters
-            col1, col2, col3 = st.columns(3)
-            
-            with col1:
-                categories = ['All'] + list(bills_df['category'].unique())
-                selected_category = st.selectbox(
-                    "🏷️ Filter by Category", 
-                    categories, 
-                    key="bills_category_filter"
-                )
+        # Add filters
+        col1, col2, col3 = st.columns(3)
+        
+        with col1:
+            # Categories actually stored, including ones outside EXPENSE_CATEGORIES
+            categories = ['All'] + db.get_categories(username)
+            selected_category = st.selectbox(
+                "🏷️ Filter by Category", 
+                categories, 
+                key="bills_category_filter"
+            )
+        
+        with col2:
+            date_range = st.selectbox(
+                "📅 Date Range",
+                ["All Time", "This Month", "Last 3 Months", "This Year"],
+                key="bills_date_filter"
+            )
+        
+        with col3:
+            search_term = st.text_input(
+                "🔍 Search", 
+                placeholder="Search descriptions...", 
+                key="bills_search_filter"
+            )
+        
+        # Start again from the first page whenever the filters change
+        filters = (selected_category, date_range, search_term)
+        if st.session_state.get("bills_active_filters") != filters:
+            st.session_state["bills_active_filters"] = filters
+            st.session_state["bills_page_cursors"] = [None]
+        
+        next_cursor = None
+        if search_term:
+            # Description search needs the whole history, served from the bills cache
+            bills_df = db.get_bills(username)
+            search_index = db.get_search_index(username)
+            filtered_df = apply_filters(bills_df, selected_category, date_range, search_term, search_index)
+        else:
+            # Category and date filters run in Firestore, one page at a time.
+            # Query errors reach the st.error below instead of looking like no bills
+            filtered_df, next_cursor = db.query_bills(
+                username,
+                category=None if selected_category == 'All' else selected_category,
+                date_from=get_date_range_start(date_range),
+                limit=BILLS_PAGE_SIZE,
+                cursor=st.session_state["bills_page_cursors"][-1]
+            )
+        
+        # Display bills
+        if not filtered_df.empty:
+            # Add delete column
+            filtered_df['Delete'] = False
             
-            with col2:
-                date_range = st.selectbox(
-                    "📅 Date Range",
-                    ["All Time", "This Month", "Last 3 Months", "This Year"],
-                    key="bills_date_filter"
-                )
+            # Format amount for display
+            display_df = filtered_df.drop(columns=['month'])
+            display_df['amount'] = display_df['amount'].apply(lambda x: f"€{x:.2f}")
             
-            with col3:
-                search_term = st.text_input(
-                    "🔍 Search", 
-                    placeholder="Search descriptions...", 
-                    key="bills_search_filter"
-                )
+            # Show data editor
+            edited_df = st.data_editor(
+                display_df,
+                column_config={
+                    "Delete": st.column_config.CheckboxColumn("🗑️", default=False),
+                    "date": st.column_config.DateColumn("📅 Date", format="YYYY-MM-DD"),
+                    "category": "🏷️ Category",
+                    "amount": "💰 Amount",
+                    "description": "📝 Description",
+                    "id": None  # Hide ID
+                },
+                hide_index=True,
+                use_container_width=True,
+                key="bills_data_editor"
+            )
             
-            # Apply filters
-            filtered_df = apply_filters(bills_df, selected_category, date_range, search_term)
+            if not search_term:
+                render_pagination(next_cursor)
             
-            # Display bills
-            if not filtered_df.empty:
-                # Add delete column
-                filtered_df['Delete'] = False
-                
-                # Format amount for display
-                display_df = filtered_df.copy()
-                display_df['amount'] = display_df['amount'].apply(lambda x: f"€{x:.2f}")
-                
-                # Show data editor
-                edited_df = st.data_editor(
-                    display_df,
-                    column_config={
-                        "Delete": st.column_config.CheckboxColumn("🗑️", default=False),
-                        "date": "📅 Date",
-                        "category": "🏷️ Category",
-                        "amount": "💰 Amount",
-                        "description": "📝 Description",
-                        "id": None  # Hide ID
-                    },
-                    hide_index=True,
-                    use_container_width=True,
-                    key="bills_data_editor"
-                )
-                
-                # Delete selected items
-                if st.button(
-                    "🗑️ Delete Selected", 
-                    type="secondary", 
-                    key="delete_selected_bills_btn"
-                ):
-                    delete_selected_bills(edited_df)
-            else:
-                st.info("No bills match your filters.")
-        else:
+            # Delete selected items
+            if st.button(
+                "🗑️ Delete Selected", 
+                type="secondary", 
+                key="delete_selected_bills_btn"
+            ):
+                delete_selected_bills(edited_df)
+        elif filters == ('All', 'All Time', '') and len(st.session_state["bills_page_cursors"]) == 1:
             st.info("📋 No bills yet. Upload your first receipt to get started!")
+        else:
+            st.info("No bills match your filters.")
             
     except Exception as e:
         st.error(f"Error loading bills: {str(e)}")
 
-def apply_filters(df, category, date_range, search_term):
+def render_pagination(next_cursor):
+    """Previous/next page controls backed by a stack of Firestore cursors"""
+    cursors = st.session_state["bills_page_cursors"]
+    
+    def go_previous():
+        if len(cursors) > 1:
+            cursors.pop()
+    
+    def go_next():
+        if next_cursor:
+            cursors.append(next_cursor)
+    
+    col_prev, col_page, col_next = st.columns([1, 2, 1])
+    with col_prev:
+        st.button("← Previous", on_click=go_previous, disabled=len(cursors) == 1, key="bills_prev_page_btn")
+    with col_page:
+        st.markdown(f"<p style='text-align: center;'>Page {len(cursors)}</p>", unsafe_allow_html=True)
+    with col_next:
+        st.button("Next →", on_click=go_next, disabled=next_cursor is None, key="bills_next_page_btn")
+
+def get_date_range_start(date_range):
+    """First date included by a date range filter, or None for all time"""
+    current_date = datetime.now().date()
+    
+    if date_range == 'This Month':
+        return current_date.replace(day=1)
+    elif date_range == 'Last 3 Months':
+        return current_date - timedelta(days=90)
+    elif date_range == 'This Year':
+        return current_date.replace(month=1, day=1)
+    return None
+
+def apply_filters(df, category, date_range, search_term, search_index=None):
     """Apply filters to bills dataframe"""
     filtered_df = df.copy()
+    if filtered_df.empty:
+        return filtered_df
     
     # Category filter
     if category != 'All':
         filtered_df = filtered_df[filtered_df['category'] == category]
     
     # Date range filter
-    if date_range != 'All Time':
-        current_date = datetime.now()
-        filtered_df['date'] = pd.to_datetime(filtered_df['date'])
-        
-        if date_range == 'This Month':
-            start_date = current_date.replace(day=1)
-            filtered_df = filtered_df[filtered_df['date'] >= start_date]
-        elif date_range == 'Last 3 Months':
-            start_date = current_date - timedelta(days=90)
-            filtered_df = filtered_df[filtered_df['date'] >= start_date]
-        elif date_range == 'This Year':
-            start_date = current_date.replace(month=1, day=1)
-            filtered_df = filtered_df[filtered_df['date'] >= start_date]
+    start_date = get_date_range_start(date_range)
+    if start_date:
+        filtered_df = filtered_df[filtered_df['date'] >= pd.Timestamp(start_date)]
     
-    # Search filter
+    # Search filter: a case-insensitive substring match either way, so results
+    # don't depend on whether the search index is cached
+    search_term = search_term.strip()
     if search_term:
-        filtered_df = filtered_df[
-            filtered_df['description'].str.contains(search_term, case=False, na=False)
-        ]
+        if search_index is not None:
+            matching_ids = search_index.search(search_term)
+            filtered_df = filtered_df[filtered_df['id'].isin(matching_ids)]
+        else:
+            filtered_df = filtered_df[
+                filtered_df['description'].str.lower().str.contains(search_term.lower(), na=False, regex=False)
+            ]
     
     return filtered_df
 
+def unlink_deleted_receipt_bills(username, bill_ids):
+    """Deleted bills no longer make their receipt count as already saved"""
+    try:
+        get_receipt_store().unlink_bills(username, bill_ids)
+    except Exception as e:
+        print(f"Error unlinking deleted bills from receipts: {e}")
+
 def delete_selected_bills(edited_df):
     """Delete selected bills"""
     try:
         items_to_delete = edited_df[edited_df['Delete']]['id'].tolist()
         
         if items_to_delete:
+            username = st.session_state["username"]
             db = FirebaseHandler()
-            deleted_count = 0
-            for bill_id in items_to_delete:
-                if db.delete_bill(bill_id):
-                    deleted_count += 1
+            results = db.delete_bills_batch(items_to_delete, username)
+            deleted_count = sum(1 for ok in results.values() if ok)
+            unlink_deleted_receipt_bills(username, [bill_id for bill_id, ok in results.items() if ok])
             
             if deleted_count > 0:
+                if deleted_count < len(results):
+                    st.warning(f"Could not delete {len(results) - deleted_count} items")
                 create_success_message(f"Deleted {deleted_count} items")
                 time.sleep(1)
                 st.rerun()
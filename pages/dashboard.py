@@ -1,8 +1,6 @@
 import streamlit as st
-import pandas as pd
-from datetime import datetime
 from database import FirebaseHandler
-from ui_components import render_header, render_metric_card
+from ui_components import render_header, render_metric_card, render_expense_table
 
 def main():
     """Main function for dashboard page"""
@@ -32,19 +30,21 @@ def render_quick_stats():
     try:
         username = st.session_state["username"]
         db = FirebaseHandler()
-        bills_df = db.get_bills(username)
+        stats = db.get_bill_stats(username)
         
-        if not bills_df.empty:
-            # Calculate statistics
-            current_month = datetime.now().strftime('%Y-%m')
-            bills_df['date'] = pd.to_datetime(bills_df['date'])
-            bills_df['month'] = bills_df['date'].dt.strftime('%Y-%m')
-            
-            current_month_bills = bills_df[bills_df['month'] == current_month]
-            current_month_total = current_month_bills['amount'].sum()
-            total_bills = len(bills_df)
-            total_amount = bills_df['amount'].sum()
-            avg_bill = bills_df['amount'].mean()
+        report = db.get_duplicate_report(username)
+        if report and report.get("duplicate_bills"):
+            st.warning(
+                f"🔁 {report['duplicate_bills']} bills look like repeats of expenses you already saved. "
+                "Review them in My Bills."
+            )
+        
+        if stats["total_bills"] > 0:
+            # Statistics come from the monthly rollup documents
+            current_month_total = stats["this_month_total"]
+            total_bills = stats["total_bills"]
+            total_amount = stats["total_spent"]
+            avg_bill = stats["average_bill"]
             
             # Render metric cards
             col1, col2, col3, col4 = st.columns(4)
@@ -84,25 +84,7 @@ def render_recent_bills():
         
         if not bills_df.empty:
             # Show last 5 bills
-            recent_bills = bills_df.head(5)
-            
-            for _, bill in recent_bills.iterrows():
-                with st.container():
-                    col1, col2, col3, col4 = st.columns([2, 1, 1, 1])
-                    
-                    with col1:
-                        st.write(f"**{bill['description'][:30]}{'...' if len(bill['description']) > 30 else ''}**")
-                    
-                    with col2:
-                        st.write(f"€{bill['amount']:.2f}")
-                    
-                    with col3:
-                        st.write(bill['category'].title())
-                    
-                    with col4:
-                        st.write(bill['date'])
-                    
-                    st.markdown("---")
+            render_expense_table(bills_df.head(5), max_description_length=30)
         else:
             st.info("📋 No bills yet. Upload your first receipt to get started!")
             
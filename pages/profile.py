@@ -114,15 +114,15 @@ def profile_page():
     try:
         username = st.session_state["username"]
         db = FirebaseHandler()
-        bills_df = db.get_bills(username)
+        stats = db.get_bill_stats(username)
         
-        if not bills_df.empty:
+        if stats["total_bills"] > 0:
             col1, col2, col3, col4 = st.columns(4)
             
-            total_bills = len(bills_df)
-            total_spent = bills_df['amount'].sum()
-            avg_bill = bills_df['amount'].mean()
-            most_category = bills_df['category'].mode()[0] if not bills_df.empty else 'N/A'
+            total_bills = stats["total_bills"]
+            total_spent = stats["total_spent"]
+            avg_bill = stats["average_bill"]
+            most_category = stats["top_category"] or 'N/A'
             
             with col1:
                 st.metric("Total Bills", total_bills)
@@ -143,11 +143,11 @@ def render_profile_stats():
     try:
         username = st.session_state["username"]
         db = FirebaseHandler()
-        bills_df = db.get_bills(username)
+        stats = db.get_bill_stats(username)
         
-        if not bills_df.empty:
-            total_bills = len(bills_df)
-            total_spent = bills_df['amount'].sum()
+        if stats["total_bills"] > 0:
+            total_bills = stats["total_bills"]
+            total_spent = stats["total_spent"]
             
             return f"""
             <div style="display: flex; justify-content: space-between; margin-bottom: 0.75rem;">
@@ -1,13 +1,13 @@
-import re
 import streamlit as st
 import pandas as pd
 from datetime import datetime
 import time
 from database import FirebaseHandler
-from image_utils import ImageProcessor
-from bill_processor import BillProcessor
+from receipt_jobs import get_job_queue
+from receipt_store import get_receipt_store
+from receipt_parser import match_category, parse_loose_item
 from ui_components import render_header, create_success_message
-from config import SUPPORTED_IMAGE_TYPES, EXPENSE_CATEGORIES
+from config import SUPPORTED_IMAGE_TYPES, EXPENSE_CATEGORIES, RECEIPT_JOB_POLL_SECONDS, MAX_BATCH_RECEIPTS
 
 def main():
     """Main function for upload page"""
@@ -19,6 +19,18 @@ def init_upload_session_state():
         st.session_state.receipt_items = None
     if "receipt_date" not in st.session_state:
         st.session_state.receipt_date = datetime.now().date()
+    if "receipt_job_id" not in st.session_state:
+        st.session_state.receipt_job_id = None
+    if "receipt_batch" not in st.session_state:
+        st.session_state.receipt_batch = None
+    if "receipt_hash" not in st.session_state:
+        st.session_state.receipt_hash = None
+    if "receipt_duplicate" not in st.session_state:
+        st.session_state.receipt_duplicate = None
+    if "manual_entry_duplicate" not in st.session_state:
+        st.session_state.manual_entry_duplicate = None
+    if "receipt_allow_duplicate" not in st.session_state:
+        st.session_state.receipt_allow_duplicate = False
 
 def parse_ai_items(raw_items):
     """Convert AI free-form lines into structured dicts."""
@@ -34,14 +46,7 @@ def parse_ai_items(raw_items):
             cat = it.get("category") or ""
         else:
             # assume string like '- Tomatenketchup: €1.29 (Category: grocery)'
-            s = str(it).strip()
-            m = re.search(r'^\s*[-*]?\s*(.+?):\s*€?\s*([\d.,]+).*?(?:Category:\s*([^)]+))?', s, re.I)
-            if m:
-                name = m.group(1).strip()
-                amt_raw = m.group(2)
-                cat = (m.group(3) or "").strip()
-            else:
-                name, amt_raw, cat = s, 0, ""
+            name, amt_raw, cat = parse_loose_item(it)
 
         # clean amount
         amt = 0.0
@@ -56,17 +61,6 @@ def parse_ai_items(raw_items):
         parsed.append({"item": name, "amount": amt, "category": cat_norm})
     return parsed
 
-def match_category(cat):
-    """Return best‑match category from EXPENSE_CATEGORIES; fallback to first."""
-    if not cat:
-        return EXPENSE_CATEGORIES[0]
-    cat_lower = cat.lower()
-    # simple contains match
-    for c in EXPENSE_CATEGORIES:
-        if cat_lower in c.lower() or c.lower() in cat_lower:
-            return c
-    return EXPENSE_CATEGORIES[0]  # fallback
-
 def upload_page():
     """Main upload page function"""
     # Initialize session state for this page
@@ -86,6 +80,10 @@ def show_receipt_upload():
     st.markdown("### 📸 Upload Receipt Image")
     st.markdown("Upload a photo of your receipt and let AI extract the information automatically.")
 
+    if st.toggle("📚 Batch mode (multiple receipts)", key="receipt_batch_mode"):
+        show_batch_receipt_upload()
+        return
+
     uploaded_file = st.file_uploader(
         "Choose a receipt image (PNG, JPG, JPEG, HEIC)",
         type=SUPPORTED_IMAGE_TYPES,
@@ -97,6 +95,12 @@ def show_receipt_upload():
         if st.button("🔍 Process with AI", use_container_width=True, type="primary", key="process_ai_btn"):
             run_ai_processing(uploaded_file)
 
+    if st.session_state.receipt_duplicate:
+        show_duplicate_warning(uploaded_file)
+
+    if st.session_state.receipt_job_id:
+        render_receipt_job_status()
+
     # Check if receipt_items exists and has content
     if (hasattr(st.session_state, 'receipt_items') and 
         st.session_state.receipt_items is not None and 
@@ -146,78 +150,382 @@ def show_extracted_items_editor(uploaded_file=None):
             use_container_width=True, 
             key="save_receipt_items_btn"
         ):
-            save_success = save_items_simple(edited_df, selected_date)
+            save_success = save_items_simple(
+                edited_df,
+                selected_date,
+                st.session_state.receipt_hash,
+                allow_duplicates=st.session_state.receipt_allow_duplicate
+            )
             if save_success:
-                st.success("🎉 All items saved successfully!")
-                st.balloons()
                 st.session_state.receipt_items = None
+                st.session_state.receipt_hash = None
+                st.session_state.receipt_allow_duplicate = False
                 time.sleep(1)
                 st.rerun()
 
 def run_ai_processing(uploaded_file):
-    """Run the AI and stash results in session_state."""
+    """Submit the receipt to the background job queue."""
     try:
-        with st.spinner("🤖 AI is analyzing your receipt..."):
-            image_processor = ImageProcessor()
-            bill_processor = BillProcessor()
-
-            image_data, mime_type = image_processor.setup_input_image(uploaded_file)
-            result = bill_processor.process_with_gemini(image_data, mime_type)
-
-        raw_items = result.get("items", [])
-        st.session_state.receipt_items = parse_ai_items(raw_items)
-
-        # Parse date
-        rec_date = datetime.now().date()
-        if result.get("date"):
-            try:
-                rec_date = datetime.strptime(result["date"], "%Y-%m-%d").date()
-            except Exception:
-                pass
-        st.session_state.receipt_date = rec_date
-
-        st.success("✅ Receipt processed! Scroll down to review and save.")
+        job_id = get_job_queue().submit(
+            st.session_state.get("username"),
+            # A view of the upload buffer; the job copies it only for the Gemini request
+            uploaded_file.getbuffer(),
+            uploaded_file.name
+        )
+        st.session_state.receipt_job_id = job_id
+        st.session_state.receipt_items = None
+        st.session_state.receipt_duplicate = None
     except Exception as e:
         st.error(f"❌ Error processing receipt: {e}")
+        st.session_state.receipt_job_id = None
+
+def resubmit_duplicate(receipt_hash, filename=None):
+    """Process a receipt flagged as a duplicate anyway, from its stored image."""
+    username = st.session_state.get("username")
+    stored = get_receipt_store().load_image(username, receipt_hash)
+    if stored is None:
+        raise ValueError("Stored receipt image not found. Please upload it again.")
+    return get_job_queue().submit(username, stored[0], filename, allow_duplicate=True)
+
+def describe_duplicates(duplicates):
+    """One-line summary of the saved receipts a new upload matches."""
+    closest = duplicates[0]
+    uploaded = datetime.fromtimestamp(closest["uploaded_at"]).strftime("%Y-%m-%d")
+    exact = "an identical" if closest["distance"] == 0 else "a very similar"
+    return f"This looks like {exact} receipt you uploaded on {uploaded} and saved as {len(closest['bill_ids'])} bills."
+
+def show_duplicate_warning(uploaded_file=None):
+    duplicate = st.session_state.receipt_duplicate
+    st.warning(f"⚠️ {describe_duplicates(duplicate['duplicates'])}")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("🔁 Process anyway", use_container_width=True, key="process_duplicate_btn"):
+            try:
+                st.session_state.receipt_job_id = resubmit_duplicate(
+                    duplicate["receipt_hash"], uploaded_file.name if uploaded_file else None
+                )
+                st.session_state.receipt_duplicate = None
+                st.rerun()
+            except Exception as e:
+                st.error(f"❌ Error processing receipt: {e}")
+    with col2:
+        if st.button("✖️ Discard", use_container_width=True, key="discard_duplicate_btn"):
+            st.session_state.receipt_duplicate = None
+            st.rerun()
+
+JOB_STATUS_MESSAGES = {
+    "queued": "⏳ Receipt queued for processing...",
+    "converting": "🖼️ Preparing your receipt image...",
+    "analyzing": "🤖 AI is analyzing your receipt..."
+}
+
+@st.fragment(run_every=RECEIPT_JOB_POLL_SECONDS)
+def render_receipt_job_status():
+    """Poll the background job and stash its result in session_state."""
+    job_id = st.session_state.get("receipt_job_id")
+    if not job_id:
+        return
+
+    job = get_job_queue().get(job_id, st.session_state.get("username"))
+    if job is None:
+        st.session_state.receipt_job_id = None
+        st.error("❌ Receipt processing job expired. Please try again.")
+        return
+
+    if job["status"] == "failed":
+        st.session_state.receipt_job_id = None
         st.session_state.receipt_items = None
+        st.error(f"❌ Error processing receipt: {job['error']}")
+    elif job["status"] == "duplicate":
+        st.session_state.receipt_job_id = None
+        st.session_state.receipt_duplicate = {
+            "receipt_hash": job["receipt_hash"],
+            "duplicates": job["duplicates"]
+        }
+        # Full rerun so the warning renders outside this fragment
+        st.rerun()
+    elif job["status"] == "done":
+        st.session_state.receipt_job_id = None
+        st.session_state.receipt_hash = job["receipt_hash"]
+        st.session_state.receipt_allow_duplicate = job["allow_duplicate"]
+        apply_ai_result(job["result"])
+        # Full rerun so the items editor renders outside this fragment
+        st.rerun()
+    else:
+        st.info(JOB_STATUS_MESSAGES.get(job["status"], "⏳ Processing..."))
+        if job["items"]:
+            # Items found so far; the editor takes over once the job is done
+            st.markdown(f"**{len(job['items'])} items found so far...**")
+            st.dataframe(pd.DataFrame(job["items"]), hide_index=True, use_container_width=True)
+
+def apply_ai_result(result):
+    """Stash a finished AI extraction in session_state."""
+    raw_items = result.get("items", [])
+    st.session_state.receipt_items = parse_ai_items(raw_items)
+
+    st.session_state.receipt_date = parse_receipt_date(result)
+
+    # Toasts survive the rerun that follows a finished job
+    if st.session_state.receipt_items:
+        st.toast("✅ Receipt processed! Scroll down to review and save.")
+    else:
+        st.toast("⚠️ No items could be extracted from this receipt.")
+
+def parse_receipt_date(result):
+    """Receipt date from an AI result, defaulting to today."""
+    rec_date = datetime.now().date()
+    if result.get("date"):
+        try:
+            rec_date = datetime.strptime(result["date"], "%Y-%m-%d").date()
+        except Exception:
+            pass
+    return rec_date
 
-def save_items_simple(items_df, date):
-    """Save rows to Firebase."""
+def items_to_bills(items_df, date, receipt_hash=None, allow_duplicate=False):
+    """Turn edited receipt rows into bill dicts for save_bills_batch."""
+    bills = []
+    for _, row in items_df.iterrows():
+        item = str(row.get("item", "")).strip()
+        try:
+            amt = float(row.get("amount", 0) or 0)
+        except Exception:
+            amt = 0.0
+        cat = row.get("category") or EXPENSE_CATEGORIES[0]
+
+        bills.append({
+            "date": date,
+            "category": cat,
+            "amount": amt,
+            "description": item,
+            "receipt_hash": receipt_hash,
+            "allow_duplicate": allow_duplicate
+        })
+    return bills
+
+def report_save_results(results, success_message="🎉 All items saved successfully!"):
+    """Show the outcome of a batched save; True if every item is now saved."""
+    saved_count = sum(1 for result in results if result["ok"])
+    duplicate_count = sum(1 for result in results if result["duplicate"])
+
+    if duplicate_count:
+        # e.g. a double-clicked save or a re-processed receipt
+        st.info(f"ℹ️ Skipped {duplicate_count} items that were already saved.")
+    if saved_count + duplicate_count == len(results):
+        if saved_count:
+            st.success(success_message)
+            st.balloons()
+        return True
+    st.warning(f"Only saved {saved_count} of {len(results) - duplicate_count} items.")
+    return False
+
+def link_receipt_bills(username, receipt_hash, results):
+    """Link the bills a receipt was saved as back to its stored image."""
+    if not receipt_hash:
+        return
+    try:
+        bill_ids = [result["id"] for result in results if result["ok"]]
+        get_receipt_store().link_bills(username, receipt_hash, bill_ids)
+    except Exception as e:
+        print(f"Error linking receipt {receipt_hash} to bills: {e}")
+
+def save_items_simple(items_df, date, receipt_hash=None, allow_duplicates=False):
+    """Save rows to Firebase; allow_duplicates saves items already saved before too."""
     try:
         username = st.session_state.get("username")
         if not username:
             st.error("❌ User not logged in.")
             return False
 
+        bills = items_to_bills(items_df, date, receipt_hash, allow_duplicates)
+
+        # One batched commit for the whole receipt instead of a write per row
         db = FirebaseHandler()
-        saved_count = 0
+        results = db.save_bills_batch(username, bills)
+        link_receipt_bills(username, receipt_hash, results)
+        return report_save_results(results)
 
-        for _, row in items_df.iterrows():
-            item = str(row.get("item", "")).strip()
-            try:
-                amt = float(row.get("amount", 0) or 0)
-            except Exception:
-                amt = 0.0
-            cat = row.get("category") or EXPENSE_CATEGORIES[0]
-
-            ok = db.save_bill(
-                username=username,
-                date=date,
-                category=cat,
-                amount=amt,
-                description=item
-            )
-            if ok:
-                saved_count += 1
+    except Exception as e:
+        st.error(f"❌ Error saving items: {e}")
+        return False
+
+def show_batch_receipt_upload():
+    uploaded_files = st.file_uploader(
+        f"Choose up to {MAX_BATCH_RECEIPTS} receipt images (PNG, JPG, JPEG, HEIC)",
+        type=SUPPORTED_IMAGE_TYPES,
+        accept_multiple_files=True,
+        help="Receipts are processed in parallel; each gets its own editor before a single save",
+        key="receipt_batch_uploader"
+    )
+
+    if uploaded_files:
+        if len(uploaded_files) > MAX_BATCH_RECEIPTS:
+            st.warning(f"Only the first {MAX_BATCH_RECEIPTS} receipts will be processed.")
+            uploaded_files = uploaded_files[:MAX_BATCH_RECEIPTS]
+
+        if st.button(
+            f"🔍 Process {len(uploaded_files)} receipts with AI",
+            use_container_width=True,
+            type="primary",
+            key="process_batch_ai_btn"
+        ):
+            run_batch_processing(uploaded_files)
+
+    batch = st.session_state.receipt_batch
+    if not batch:
+        return
+
+    if any(receipt["status"] not in FINISHED_STATUSES for receipt in batch):
+        render_batch_job_status()
+    else:
+        show_batch_items_editor(batch)
+
+def run_batch_processing(uploaded_files):
+    """Submit every receipt to the background job queue."""
+    job_queue = get_job_queue()
+    username = st.session_state.get("username")
+    today = datetime.now().date()
 
-        if saved_count == len(items_df):
-            return True
+    batch = []
+    for uploaded_file in uploaded_files:
+        try:
+            job_id = job_queue.submit(username, uploaded_file.getbuffer(), uploaded_file.name)
+            batch.append({"job_id": job_id, "name": uploaded_file.name, "status": "queued",
+                          "items": None, "date": today, "error": None,
+                          "receipt_hash": None, "duplicates": [], "allow_duplicate": False})
+        except Exception as e:
+            batch.append({"job_id": None, "name": uploaded_file.name, "status": "failed",
+                          "items": None, "date": today, "error": str(e),
+                          "receipt_hash": None, "duplicates": [], "allow_duplicate": False})
+    st.session_state.receipt_batch = batch
+
+# Batch receipts that need no more polling
+FINISHED_STATUSES = ("done", "failed", "duplicate")
+
+@st.fragment(run_every=RECEIPT_JOB_POLL_SECONDS)
+def render_batch_job_status():
+    """Poll all batch jobs and show overall progress."""
+    batch = st.session_state.receipt_batch
+    if not batch:
+        return
+
+    job_queue = get_job_queue()
+    username = st.session_state.get("username")
+    for receipt in batch:
+        if receipt["status"] in FINISHED_STATUSES:
+            continue
+
+        job = job_queue.get(receipt["job_id"], username)
+        if job is None:
+            receipt["status"] = "failed"
+            receipt["error"] = "Processing job expired"
+        elif job["status"] == "duplicate":
+            receipt["status"] = "duplicate"
+            receipt["receipt_hash"] = job["receipt_hash"]
+            receipt["duplicates"] = job["duplicates"]
+        elif job["status"] == "done":
+            receipt["status"] = "done"
+            receipt["receipt_hash"] = job["receipt_hash"]
+            receipt["items"] = parse_ai_items(job["result"].get("items", []))
+            receipt["date"] = parse_receipt_date(job["result"])
+        elif job["status"] == "failed":
+            receipt["status"] = "failed"
+            receipt["error"] = job["error"]
         else:
-            st.warning(f"Only saved {saved_count} of {len(items_df)} items.")
+            receipt["status"] = job["status"]
+
+    finished = sum(1 for receipt in batch if receipt["status"] in FINISHED_STATUSES)
+    if finished == len(batch):
+        # Full rerun so the per-receipt editors render outside this fragment
+        st.rerun()
+    st.progress(finished / len(batch), text=f"🤖 Processed {finished} of {len(batch)} receipts...")
+
+def show_batch_items_editor(batch):
+    st.markdown("### 📝 Extracted Items")
+    st.markdown("Review and edit each receipt, then save everything at once:")
+
+    edited_receipts = []
+    for i, receipt in enumerate(batch):
+        if receipt["status"] == "failed":
+            st.error(f"❌ {receipt['name']}: {receipt['error']}")
+            continue
+        if receipt["status"] == "duplicate":
+            st.warning(f"⚠️ {receipt['name']}: {describe_duplicates(receipt['duplicates'])} Skipped.")
+            if st.button("🔁 Process anyway", key=f"batch_duplicate_btn_{receipt['job_id']}"):
+                try:
+                    receipt["job_id"] = resubmit_duplicate(receipt["receipt_hash"], receipt["name"])
+                    receipt["status"] = "queued"
+                    receipt["allow_duplicate"] = True
+                    st.rerun()
+                except Exception as e:
+                    st.error(f"❌ {receipt['name']}: {e}")
+            continue
+        if not receipt["items"]:
+            st.warning(f"⚠️ {receipt['name']}: no items could be extracted.")
+            continue
+
+        with st.expander(f"🧾 {receipt['name']} ({len(receipt['items'])} items)", expanded=i == 0):
+            edited_df = st.data_editor(
+                pd.DataFrame(receipt["items"]),
+                key=f"batch_items_editor_{receipt['job_id']}",
+                column_config={
+                    "item": st.column_config.TextColumn("Item Description"),
+                    "amount": st.column_config.NumberColumn(
+                        "Amount (€)", min_value=0, format="€%.2f", step=0.01
+                    ),
+                    "category": st.column_config.SelectboxColumn("Category", options=EXPENSE_CATEGORIES)
+                },
+                hide_index=True,
+                use_container_width=True
+            )
+            selected_date = st.date_input(
+                "📅 Date",
+                value=receipt["date"],
+                key=f"batch_date_{receipt['job_id']}"
+            )
+            edited_receipts.append(
+                (edited_df, selected_date, receipt["receipt_hash"], receipt.get("allow_duplicate", False))
+            )
+
+    if not edited_receipts:
+        return
+
+    total_amount = sum(df["amount"].sum(numeric_only=True) for df, _, _, _ in edited_receipts)
+    st.metric("💰 Batch Total", f"€{total_amount:.2f}")
+
+    if st.button(
+        f"💾 Save All {len(edited_receipts)} Receipts",
+        type="primary",
+        use_container_width=True,
+        key="save_batch_receipts_btn"
+    ):
+        if save_batch_receipts(edited_receipts):
+            st.session_state.receipt_batch = None
+            time.sleep(1)
+            st.rerun()
+
+def save_batch_receipts(edited_receipts):
+    """Save the items of every receipt in one batched call."""
+    try:
+        username = st.session_state.get("username")
+        if not username:
+            st.error("❌ User not logged in.")
             return False
 
+        bills, receipt_ranges = [], []
+        for items_df, date, receipt_hash, allow_duplicate in edited_receipts:
+            receipt_bills = items_to_bills(items_df, date, receipt_hash, allow_duplicate)
+            receipt_ranges.append((receipt_hash, len(bills), len(bills) + len(receipt_bills)))
+            bills.extend(receipt_bills)
+
+        db = FirebaseHandler()
+        results = db.save_bills_batch(username, bills)
+        for receipt_hash, start, end in receipt_ranges:
+            link_receipt_bills(username, receipt_hash, results[start:end])
+        return report_save_results(results, "🎉 All receipts saved successfully!")
+
     except Exception as e:
-        st.error(f"❌ Error saving items: {e}")
+        st.error(f"❌ Error saving receipts: {e}")
         return False
 
 def show_manual_entry():
@@ -259,25 +567,56 @@ def show_manual_entry():
 
         if submitted:
             if amount > 0 and description.strip():
+                entry = {
+                    "date": date,
+                    "category": category,
+                    "amount": amount,
+                    "description": description.strip()
+                }
                 try:
                     db = FirebaseHandler()
-                    if db.save_bill(
-                        username=st.session_state.get("username"),
-                        date=date,
-                        category=category,
-                        amount=amount,
-                        description=description.strip()
-                    ):
-                        create_success_message("✅ Entry saved successfully!")
-                        st.balloons()
-                        time.sleep(1)
-                        st.rerun()
+                    if db.find_duplicate(st.session_state.get("username"), date, amount, entry["description"]):
+                        # The form clears on submit, so keep the entry for "Save anyway"
+                        st.session_state.manual_entry_duplicate = entry
                     else:
-                        st.error("❌ Failed to save entry. Please try again.")
+                        save_manual_entry(entry)
                 except Exception as e:
                     st.error(f"❌ Error saving entry: {e}")
             else:
                 if amount <= 0:
                     st.error("❌ Please enter an amount greater than 0")
                 if not description.strip():
-                    st.error("❌ Please enter a description")
\ No newline at end of file
+                    st.error("❌ Please enter a description")
+
+    entry = st.session_state.get("manual_entry_duplicate")
+    if entry:
+        st.warning(
+            f"⚠️ You already saved '{entry['description']}' for €{entry['amount']:.2f} "
+            f"on {entry['date']}. Save it again?"
+        )
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("💾 Save anyway", use_container_width=True, key="manual_entry_save_anyway_btn"):
+                st.session_state.manual_entry_duplicate = None
+                save_manual_entry(entry, allow_duplicate=True)
+        with col2:
+            if st.button("✖️ Cancel", use_container_width=True, key="manual_entry_cancel_btn"):
+                st.session_state.manual_entry_duplicate = None
+                st.rerun()
+
+def save_manual_entry(entry, allow_duplicate=False):
+    try:
+        db = FirebaseHandler()
+        if db.save_bill(
+            username=st.session_state.get("username"),
+            allow_duplicate=allow_duplicate,
+            **entry
+        ):
+            create_success_message("✅ Entry saved successfully!")
+            st.balloons()
+            time.sleep(1)
+            st.rerun()
+        else:
+            st.error("❌ Failed to save entry. Please try again.")
+    except Exception as e:
+        st.error(f"❌ Error saving entry: {e}")
\ No newline at end of file
@@ -0,0 +1,116 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from image_utils import ImageProcessor
+from bill_processor import BillProcessor
+from receipt_store import get_receipt_store
+from config import RECEIPT_JOB_WORKERS, RECEIPT_JOB_TTL_SECONDS, GEMINI_STREAMING
+
+class ReceiptJobQueue:
+    """Background worker pool for receipt image conversion and Gemini extraction.
+
+    Jobs are kept in memory for RECEIPT_JOB_TTL_SECONDS after they finish so
+    the upload page can poll them by id across reruns.
+    """
+
+    def __init__(self, max_workers, ttl_seconds):
+        self.ttl_seconds = ttl_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="receipt-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, username, image_bytes, filename=None, allow_duplicate=False):
+        """Queue a receipt image for processing and return its job id.
+
+        image_bytes may be a memoryview of the upload buffer; it is only read.
+
+        Unless allow_duplicate is set, a receipt that looks like one the user
+        already saved stops with status "duplicate" before calling Gemini.
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._prune(now)
+            self._jobs[job_id] = {
+                "id": job_id,
+                "username": username,
+                "filename": filename,
+                "status": "queued",
+                "result": None,
+                "error": None,
+                "receipt_hash": None,
+                "duplicates": [],
+                # Set by "Process anyway"; the save then keeps repeated items too
+                "allow_duplicate": allow_duplicate,
+                # Items parsed so far while the response streams in
+                "items": [],
+                "submitted_at": now,
+                "finished_at": None
+            }
+        self._executor.submit(self._run, job_id, username, image_bytes, allow_duplicate)
+        return job_id
+
+    def get(self, job_id, username):
+        """Return a snapshot of a user's job, or None if unknown or expired"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["username"] != username:
+                return None
+            return {**job, "items": list(job["items"]), "duplicates": list(job["duplicates"])}
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields)
+
+    def _add_item(self, job_id, item):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id]["items"].append(item)
+
+    def _run(self, job_id, username, image_bytes, allow_duplicate):
+        try:
+            self._update(job_id, status="converting")
+            image_data, mime_type = ImageProcessor.setup_input_image(image_bytes)
+
+            try:
+                receipt = get_receipt_store().add(username, image_data, mime_type)
+                self._update(job_id, receipt_hash=receipt["hash"], duplicates=receipt["duplicates"])
+            except Exception as e:
+                # Storing is best effort; extraction still works without it
+                print(f"Error storing receipt for job {job_id}: {e}")
+                receipt = None
+
+            if receipt and receipt["duplicates"] and not allow_duplicate:
+                self._update(job_id, status="duplicate", finished_at=time.time())
+                return
+
+            self._update(job_id, status="analyzing")
+            on_item = (lambda item: self._add_item(job_id, item)) if GEMINI_STREAMING else None
+            result = BillProcessor().process_with_gemini(image_data, mime_type, on_item=on_item)
+
+            self._update(job_id, status="done", result=result, finished_at=time.time())
+        except Exception as e:
+            print(f"Error in receipt job {job_id}: {e}")
+            self._update(job_id, status="failed", error=str(e), finished_at=time.time())
+
+    def _prune(self, now):
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job["finished_at"] and now - job["finished_at"] > self.ttl_seconds
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+def get_job_queue():
+    """Process-wide receipt job queue shared by all sessions"""
+    global _job_queue
+    if _job_queue is None:
+        with _job_queue_lock:
+            if _job_queue is None:
+                _job_queue = ReceiptJobQueue(RECEIPT_JOB_WORKERS, RECEIPT_JOB_TTL_SECONDS)
+    return _job_queue
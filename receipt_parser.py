@@ -0,0 +1,175 @@
+"""Parser for Gemini free-text receipt responses.
+
+Extracts the date, stated total and line items from a response with
+precompiled patterns, each field by its own search. Also usable offline to re-parse stored raw text:
+
+    python receipt_parser.py response.txt
+    python receipt_parser.py --cache-dir .cache/extractions
+"""
+import argparse
+import json
+import os
+import re
+import sys
+from functools import lru_cache
+from constants import EXPENSE_CATEGORIES
+
+# Patterns in priority order: the first pattern that matches anywhere wins
+DATE_PATTERNS = [
+    re.compile(r"Date: (\d{4}-\d{2}-\d{2})"),
+    re.compile(r"(\d{4}-\d{2}-\d{2})"),
+    re.compile(r"(\d{2}/\d{2}/\d{4})"),
+    re.compile(r"(\d{2}-\d{2}-\d{4})"),
+]
+
+AMOUNT_PATTERNS = [
+    re.compile(r"Total Amount: €(\d+\.?\d*)", re.IGNORECASE),
+    re.compile(r"Total: €(\d+\.?\d*)", re.IGNORECASE),
+    re.compile(r"Amount: €(\d+\.?\d*)", re.IGNORECASE),
+    re.compile(r"€(\d+\.?\d*)", re.IGNORECASE),
+    re.compile(r"(\d+\.?\d*) ?EUR", re.IGNORECASE),
+]
+
+ITEM_PATTERN = re.compile(r"- (.*?): €(\d+\.?\d*) \(Category: (.*?)\)")
+
+# Looser format used when normalizing items that arrive as plain strings
+LOOSE_ITEM_PATTERN = re.compile(r'^\s*[-*]?\s*(.+?):\s*€?\s*([\d.,]+).*?(?:Category:\s*([^)]+))?', re.I)
+
+VALID_CATEGORIES = frozenset(EXPENSE_CATEGORIES)
+
+# Every substring of a category name, mapped to the first category containing it
+CATEGORY_LOOKUP = {}
+for _index, _category in enumerate(EXPENSE_CATEGORIES):
+    for _start in range(len(_category)):
+        for _end in range(_start + 1, len(_category) + 1):
+            CATEGORY_LOOKUP.setdefault(_category[_start:_end], _index)
+
+def parse_item_line(line):
+    """Parse one '- Item: €X (Category: y)' line, or return None"""
+    if not line.startswith('-'):
+        return None
+
+    match = ITEM_PATTERN.match(line)
+    return _item_from_match(match) if match else None
+
+def _item_from_match(match):
+    item = match.group(1).strip()
+    try:
+        amount = float(match.group(2))
+    except ValueError:
+        return None
+    category = match.group(3).strip().lower()
+    # Only return valid items
+    if item and amount > 0 and category in VALID_CATEGORIES:
+        return {
+            'item': item,
+            'amount': amount,
+            'category': category
+        }
+    return None
+
+def _first_value(patterns, text, convert=str):
+    """Value of the first pattern that matches anywhere in text and converts cleanly"""
+    for pattern in patterns:
+        match = pattern.search(text)
+        if match:
+            try:
+                return convert(match.group(1))
+            except ValueError:
+                continue
+    return None
+
+def extract_date(text):
+    """First date in a response, or None"""
+    return _first_value(DATE_PATTERNS, text)
+
+def extract_total(text):
+    """Stated total of a response, or 0.0"""
+    total = _first_value(AMOUNT_PATTERNS, text, float)
+    return total if total is not None else 0.0
+
+def extract_items(text):
+    """Valid '- Item: €X (Category: y)' lines of a response"""
+    items = []
+    match_item = ITEM_PATTERN.match
+    for line in text.split('\n'):
+        if not line.startswith('-'):
+            continue
+        match = match_item(line)
+        item = _item_from_match(match) if match else None
+        if item:
+            items.append(item)
+    return items
+
+def parse_receipt_text(text):
+    """Extract date, stated total and items from a response"""
+    return {
+        'date': extract_date(text),
+        'total': extract_total(text),
+        'items': extract_items(text)
+    }
+
+def match_category(cat):
+    """Return best-match category from EXPENSE_CATEGORIES; fallback to first."""
+    if not cat:
+        return EXPENSE_CATEGORIES[0]
+    return _match_category_lower(cat.lower())
+
+@lru_cache(maxsize=1024)
+def _match_category_lower(cat_lower):
+    # Model output repeats the same few labels, so results are memoized
+
+    # A fragment of a category name is a single table lookup; otherwise
+    # look for a category name inside the text, in category order
+    best = CATEGORY_LOOKUP.get(cat_lower, len(EXPENSE_CATEGORIES))
+    for index in range(best):
+        if EXPENSE_CATEGORIES[index] in cat_lower:
+            best = index
+            break
+    if best < len(EXPENSE_CATEGORIES):
+        return EXPENSE_CATEGORIES[best]
+    return EXPENSE_CATEGORIES[0]  # fallback
+
+def parse_loose_item(text):
+    """Parse a free-form item string into (name, raw amount, raw category)"""
+    s = str(text).strip()
+    match = LOOSE_ITEM_PATTERN.search(s)
+    if match:
+        return match.group(1).strip(), match.group(2), (match.group(3) or "").strip()
+    return s, 0, ""
+
+def _iter_cached_texts(cache_dir):
+    for root, _, files in os.walk(cache_dir):
+        for name in sorted(files):
+            if not name.endswith(".json"):
+                continue
+            with open(os.path.join(root, name), "r", encoding="utf-8") as f:
+                text = json.load(f).get("raw_text", "")
+            # Structured (JSON mode) responses aren't free text; skip them
+            if not text.lstrip().startswith("{"):
+                yield name[:-len(".json")], text
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-parse stored Gemini receipt responses")
+    parser.add_argument("files", nargs="*", help="Text files with raw responses ('-' for stdin)")
+    parser.add_argument("--cache-dir", help="Re-parse every entry of an extraction cache directory")
+    args = parser.parse_args(argv)
+
+    sources = []
+    for path in args.files:
+        if path == "-":
+            sources.append(("stdin", sys.stdin.read()))
+        else:
+            with open(path, "r", encoding="utf-8") as f:
+                sources.append((path, f.read()))
+    if args.cache_dir:
+        sources.extend(_iter_cached_texts(args.cache_dir))
+    if not sources:
+        parser.error("pass one or more files, '-' or --cache-dir")
+
+    for source, text in sources:
+        print(json.dumps({"source": source, **parse_receipt_text(text)}, ensure_ascii=False))
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
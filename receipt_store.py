@@ -0,0 +1,243 @@
+import hashlib
+import io
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import closing
+from PIL import Image
+from config import (
+    RECEIPT_STORE_DIR,
+    RECEIPT_DUPLICATE_MAX_DISTANCE,
+    RECEIPT_UNLINKED_TTL_SECONDS,
+    RECEIPT_PRUNE_INTERVAL_SECONDS
+)
+
+MIME_EXTENSIONS = {"image/jpeg": ".jpg", "image/webp": ".webp", "image/png": ".png"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS receipts (
+    username TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    phash INTEGER NOT NULL,
+    mime_type TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    uploaded_at REAL NOT NULL,
+    PRIMARY KEY (username, hash)
+);
+CREATE TABLE IF NOT EXISTS receipt_bills (
+    username TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    bill_id TEXT NOT NULL,
+    PRIMARY KEY (username, bill_id)
+);
+CREATE INDEX IF NOT EXISTS receipt_bills_by_hash ON receipt_bills (username, hash);
+CREATE INDEX IF NOT EXISTS receipts_by_hash ON receipts (hash);
+"""
+
+def _to_signed(value):
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+def _to_unsigned(value):
+    return value & ((1 << 64) - 1)
+
+class ReceiptStore:
+    """Content-addressed store for normalized receipt images.
+
+    Image files live under blobs/ named by their sha256, so identical
+    uploads are stored once. A SQLite database records who uploaded what,
+    each image's perceptual hash and which saved bills came from it.
+    Receipts that never get saved bills are pruned after unlinked_ttl seconds.
+    """
+
+    def __init__(self, directory, max_distance=RECEIPT_DUPLICATE_MAX_DISTANCE,
+                 unlinked_ttl=RECEIPT_UNLINKED_TTL_SECONDS):
+        self.directory = directory
+        self.max_distance = max_distance
+        self.unlinked_ttl = unlinked_ttl
+        self._last_pruned = 0.0
+        self.db_path = os.path.join(directory, "receipts.sqlite3")
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        # A connection per call keeps the store safe to use from job threads
+        return sqlite3.connect(self.db_path, timeout=10)
+
+    @staticmethod
+    def content_hash(image_data):
+        return hashlib.sha256(image_data).hexdigest()
+
+    @staticmethod
+    def perceptual_hash(image_data):
+        """64-bit difference hash (dHash) of an image.
+
+        Each bit says whether a pixel is brighter than its right neighbour in
+        a 9x8 grayscale thumbnail, so recompressed, rescaled or slightly
+        brightened copies of the same receipt hash within a few bits.
+        """
+        with Image.open(io.BytesIO(image_data)) as image:
+            # JPEG can decode straight to a tiny grayscale image
+            image.draft("L", (64, 64))
+            pixels = list(image.convert("L").resize((9, 8), Image.Resampling.LANCZOS).getdata())
+
+        value = 0
+        for row in range(8):
+            for col in range(8):
+                left, right = pixels[row * 9 + col], pixels[row * 9 + col + 1]
+                value = (value << 1) | (left > right)
+        return value
+
+    def _blob_path(self, receipt_hash, mime_type):
+        extension = MIME_EXTENSIONS.get(mime_type, ".bin")
+        return os.path.join(self.directory, "blobs", receipt_hash[:2], receipt_hash + extension)
+
+    def _write_blob(self, path, image_data):
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write atomically so a concurrent upload of the same image never sees a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(image_data)
+        os.replace(tmp_path, path)
+
+    def add(self, username, image_data, mime_type):
+        """Store a normalized receipt image for a user.
+
+        Returns {"hash", "phash", "duplicates"}, where duplicates lists the
+        user's earlier receipts that look the same and already have saved
+        bills, closest first.
+        """
+        receipt_hash = self.content_hash(image_data)
+        phash = self.perceptual_hash(image_data)
+        duplicates = self.find_similar(username, phash)
+
+        # Under the lock so pruning never removes the blob between the write and the insert
+        with self._lock:
+            self._write_blob(self._blob_path(receipt_hash, mime_type), image_data)
+            with closing(self._connect()) as conn, conn:
+                # A re-upload restarts the unlinked retention period
+                conn.execute(
+                    "INSERT INTO receipts (username, hash, phash, mime_type, size, uploaded_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (username, hash) DO UPDATE SET uploaded_at = excluded.uploaded_at",
+                    (username, receipt_hash, _to_signed(phash), mime_type, len(image_data), time.time())
+                )
+
+        if time.monotonic() - self._last_pruned > RECEIPT_PRUNE_INTERVAL_SECONDS:
+            self._last_pruned = time.monotonic()
+            try:
+                self.prune_unlinked()
+            except Exception as e:
+                print(f"Error pruning stored receipts: {e}")
+        return {"hash": receipt_hash, "phash": phash, "duplicates": duplicates}
+
+    def find_similar(self, username, phash):
+        """A user's saved receipts within max_distance bits of a perceptual hash"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT r.hash, r.phash, r.uploaded_at, GROUP_CONCAT(b.bill_id) "
+                "FROM receipts r JOIN receipt_bills b ON b.username = r.username AND b.hash = r.hash "
+                "WHERE r.username = ? GROUP BY r.hash",
+                (username,)
+            ).fetchall()
+
+        matches = []
+        for receipt_hash, other, uploaded_at, bill_ids in rows:
+            distance = (phash ^ _to_unsigned(other)).bit_count()
+            if distance <= self.max_distance:
+                matches.append({
+                    "hash": receipt_hash,
+                    "distance": distance,
+                    "uploaded_at": uploaded_at,
+                    "bill_ids": bill_ids.split(",")
+                })
+        return sorted(matches, key=lambda match: match["distance"])
+
+    def link_bills(self, username, receipt_hash, bill_ids):
+        """Record which saved bills were created from a receipt"""
+        if not receipt_hash or not bill_ids:
+            return
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO receipt_bills (username, hash, bill_id) VALUES (?, ?, ?)",
+                [(username, receipt_hash, bill_id) for bill_id in bill_ids]
+            )
+
+    def unlink_bills(self, username, bill_ids):
+        """Forget deleted bills, so their receipt no longer counts as saved"""
+        if not bill_ids:
+            return
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.executemany(
+                "DELETE FROM receipt_bills WHERE username = ? AND bill_id = ?",
+                [(username, bill_id) for bill_id in bill_ids]
+            )
+
+    def prune_unlinked(self, older_than_seconds=None):
+        """Remove receipts with no linked bills uploaded before the retention period.
+
+        Blobs are deleted once no user's receipt refers to them. Returns the
+        number of receipt records removed.
+        """
+        ttl = self.unlinked_ttl if older_than_seconds is None else older_than_seconds
+        cutoff = time.time() - ttl
+        with self._lock:
+            with closing(self._connect()) as conn, conn:
+                stale = conn.execute(
+                    "SELECT r.username, r.hash, r.mime_type FROM receipts r "
+                    "WHERE r.uploaded_at < ? AND NOT EXISTS ("
+                    "SELECT 1 FROM receipt_bills b WHERE b.username = r.username AND b.hash = r.hash)",
+                    (cutoff,)
+                ).fetchall()
+                conn.executemany(
+                    "DELETE FROM receipts WHERE username = ? AND hash = ?",
+                    [(username, receipt_hash) for username, receipt_hash, _ in stale]
+                )
+                blobs = {(receipt_hash, mime_type) for _, receipt_hash, mime_type in stale}
+                # Identical images are shared between users, so keep blobs still referenced
+                orphaned = [
+                    (receipt_hash, mime_type) for receipt_hash, mime_type in blobs
+                    if conn.execute("SELECT 1 FROM receipts WHERE hash = ? LIMIT 1", (receipt_hash,)).fetchone() is None
+                ]
+
+            for receipt_hash, mime_type in orphaned:
+                try:
+                    os.remove(self._blob_path(receipt_hash, mime_type))
+                except FileNotFoundError:
+                    pass
+        return len(stale)
+
+    def load_image(self, username, receipt_hash):
+        """Return (image bytes, mime_type) of a user's stored receipt, or None"""
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT mime_type FROM receipts WHERE username = ? AND hash = ?",
+                (username, receipt_hash)
+            ).fetchone()
+        if row is None:
+            return None
+        try:
+            with open(self._blob_path(receipt_hash, row[0]), "rb") as f:
+                return f.read(), row[0]
+        except OSError as e:
+            print(f"Error reading stored receipt {receipt_hash}: {e}")
+            return None
+
+_receipt_store = None
+_receipt_store_lock = threading.Lock()
+
+def get_receipt_store():
+    """Process-wide receipt store shared by all sessions"""
+    global _receipt_store
+    if _receipt_store is None:
+        with _receipt_store_lock:
+            if _receipt_store is None:
+                _receipt_store = ReceiptStore(RECEIPT_STORE_DIR)
+    return _receipt_store
@@ -0,0 +1,138 @@
+import threading
+from array import array
+
+# Approximate CPython overheads, in bytes, behind memory_usage(): a posting
+# key (dict slot, short str and array header) and an indexed row (list
+# slots, row lookup entry and the str header of its text)
+KEY_OVERHEAD = 180
+ROW_OVERHEAD = 170
+
+# Removed rows are reclaimed by a rebuild once they outnumber live ones
+COMPACT_MIN_DEAD_ROWS = 256
+
+class BillSearchIndex:
+    """Per-user inverted index over bill descriptions.
+
+    Terms match as case-insensitive substrings, like str.contains: terms of
+    three or more characters go through a trigram index, shorter ones scan
+    the stored descriptions. Bills are numbered by row and postings are
+    compact arrays of row numbers; removed rows are skipped when searching
+    until a rebuild reclaims them.
+    """
+
+    def __init__(self):
+        self._bill_ids = []  # row -> bill id, None once removed
+        self._texts = []  # row -> lowercased description, None once removed
+        self._rows = {}  # bill id -> row
+        self._trigrams = {}
+        self._postings = 0
+        self._text_bytes = 0
+        self._dead_rows = 0
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_frame(cls, df):
+        index = cls()
+        if not df.empty and 'id' in df.columns and 'description' in df.columns:
+            index.add_many(zip(df['id'], df['description']))
+        return index
+
+    @staticmethod
+    def _trigrams_of(text):
+        return {text[i:i + 3] for i in range(len(text) - 2)}
+
+    def __len__(self):
+        return len(self._rows)
+
+    def memory_usage(self):
+        """Approximate footprint in bytes, for cache size accounting"""
+        with self._lock:
+            return (
+                self._postings * array('I').itemsize + self._text_bytes
+                + len(self._trigrams) * KEY_OVERHEAD + len(self._bill_ids) * ROW_OVERHEAD
+            )
+
+    def add_many(self, bills):
+        """Index (bill_id, description) pairs, replacing existing entries"""
+        with self._lock:
+            for bill_id, description in bills:
+                self._remove(bill_id)
+                # Missing descriptions arrive as None or NaN; neither should match "nan"
+                self._add(bill_id, description.lower() if isinstance(description, str) else "")
+            self._compact_if_sparse()
+
+    def _add(self, bill_id, text):
+        row = len(self._bill_ids)
+        self._bill_ids.append(bill_id)
+        self._texts.append(text)
+        self._rows[bill_id] = row
+        self._text_bytes += len(text)
+
+        trigrams = self._trigrams_of(text)
+        for trigram in trigrams:
+            postings = self._trigrams.get(trigram)
+            if postings is None:
+                postings = self._trigrams[trigram] = array('I')
+            postings.append(row)
+        self._postings += len(trigrams)
+
+    def remove_many(self, bill_ids):
+        with self._lock:
+            for bill_id in bill_ids:
+                self._remove(bill_id)
+            self._compact_if_sparse()
+
+    def _remove(self, bill_id):
+        # Postings keep the row until the next rebuild; searches skip it
+        row = self._rows.pop(bill_id, None)
+        if row is None:
+            return
+        self._text_bytes -= len(self._texts[row])
+        self._bill_ids[row] = None
+        self._texts[row] = None
+        self._dead_rows += 1
+
+    def _compact_if_sparse(self):
+        if self._dead_rows < COMPACT_MIN_DEAD_ROWS or self._dead_rows < len(self._rows):
+            return
+
+        live = [(bill_id, text) for bill_id, text in zip(self._bill_ids, self._texts) if bill_id is not None]
+        self._bill_ids, self._texts, self._rows = [], [], {}
+        self._trigrams = {}
+        self._postings = self._text_bytes = self._dead_rows = 0
+        for bill_id, text in live:
+            self._add(bill_id, text)
+
+    def search(self, term):
+        """Return the ids of bills whose description matches the search term"""
+        term = str(term or "").lower().strip()
+        if not term:
+            return set()
+
+        with self._lock:
+            if len(term) >= 3:
+                return self._search_substring(term)
+            return self._search_scan(term)
+
+    def _search_substring(self, term):
+        postings = []
+        for trigram in self._trigrams_of(term):
+            rows = self._trigrams.get(trigram)
+            if rows is None:
+                return set()
+            postings.append(rows)
+
+        # Checking the full substring on the rarest trigram's rows is cheaper
+        # than intersecting the other posting lists first
+        texts, bill_ids = self._texts, self._bill_ids
+        return {
+            bill_ids[row] for row in min(postings, key=len)
+            if texts[row] is not None and term in texts[row]
+        }
+
+    def _search_scan(self, term):
+        # One or two characters narrow down too little for an index to help
+        return {
+            bill_id for bill_id, text in zip(self._bill_ids, self._texts)
+            if text is not None and term in text
+        }
@@ -1,3 +1,4 @@
+import html
 import streamlit as st
 from config import THEME_COLORS
 
@@ -315,6 +316,35 @@ def apply_custom_css():
         font-weight: 500;
     }}
     
+    /* Compact expense table */
+    .expense-table {{
+        width: 100%;
+        border-collapse: collapse;
+        font-size: 0.95rem;
+    }}
+    
+    .expense-table th {{
+        text-align: left;
+        color: {THEME_COLORS['text_light']};
+        font-weight: 500;
+        padding: 0.5rem 0.75rem;
+        border-bottom: 2px solid rgba(102, 126, 234, 0.2);
+    }}
+    
+    .expense-table td {{
+        padding: 0.6rem 0.75rem;
+        color: {THEME_COLORS['text']};
+        border-bottom: 1px solid rgba(102, 126, 234, 0.1);
+    }}
+    
+    .expense-table .expense-description {{
+        font-weight: 600;
+    }}
+    
+    .expense-table .expense-amount {{
+        white-space: nowrap;
+    }}
+    
     /* Mobile Responsive */
     @media (max-width: 768px) {{
         .app-title {{
@@ -414,4 +444,30 @@ def render_sidebar_profile_card(user_data, username):
         <p class="profile-username">@{username}</p>
     </div>
     """
-    st.markdown(profile_html, unsafe_allow_html=True)
\ No newline at end of file
+    st.markdown(profile_html, unsafe_allow_html=True)
+
+def render_expense_table(df, max_description_length=40):
+    """Render bills (description, amount, category, date) as one HTML table.
+
+    Cells are formatted column-wise and sent as a single element, instead
+    of a row of widgets per bill.
+    """
+    description = df['description'].fillna('').astype(str)
+    truncated = description.str.slice(0, max_description_length)
+    truncated = truncated.where(description.str.len() <= max_description_length, truncated + '...')
+
+    rows = (
+        '<tr><td class="expense-description">' + truncated.map(html.escape)
+        + '</td><td class="expense-amount">€' + df['amount'].map('{:.2f}'.format)
+        + '</td><td>' + df['category'].astype(object).fillna('').astype(str).str.title().map(html.escape)
+        + '</td><td>' + df['date'].dt.strftime('%Y-%m-%d').fillna('')
+        + '</td></tr>'
+    )
+
+    table_html = f"""
+    <table class="expense-table fade-in">
+        <thead><tr><th>Description</th><th>Amount</th><th>Category</th><th>Date</th></tr></thead>
+        <tbody>{''.join(rows)}</tbody>
+    </table>
+    """
+    st.markdown(table_html, unsafe_allow_html=True)
@@ -52,7 +52,13 @@ def logout_user():
         "remember_me",
         "saved_session",
         "receipt_items",
-        "receipt_date"
+        "receipt_date",
+        "receipt_job_id",
+        "receipt_batch",
+        "receipt_hash",
+        "receipt_duplicate",
+        "manual_entry_duplicate",
+        "receipt_allow_duplicate"
     ]
     
     for key in keys_to_clear: